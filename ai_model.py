@@ -1,22 +1,156 @@
-from transformers import pipeline
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import config
+import metrics
+import model_registry
+from chunking import aggregate_scores, chunk_text
+
+CANDIDATE_LABELS = [
+    "Legitimate Job Offer",
+    "Phishing/Scam Email",
+    "Spam/Promotional Content"
+]
+# Same hypothesis the zero-shot pipeline uses by default
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+
+def _load_classifier():
+    from backends import load_classifier
+
+    # fp32, int8 or ONNX depending on config.INFERENCE_BACKEND
+    return load_classifier()
+
+
+model_registry.register("classifier", _load_classifier, warmup=lambda _: classify_texts(["Warmup message."]))
+
+
+def get_classifier():
+    return model_registry.get("classifier")
+
+
+def _nli_label_ids(model):
+    label2id = {label.lower(): idx for label, idx in model.config.label2id.items()}
+    return label2id["contradiction"], label2id["entailment"]
+
+
+def classify_texts(texts, batch_size=None, classifier=None):
+    # Score every (chunk, label) pair with the NLI model in padded batches.
+    # Matches the pipeline's multi_label=True output: each label gets its own
+    # entailment-vs-contradiction softmax. Long texts are split into chunks
+    # within the token budget and the chunk scores aggregated per message.
+    import torch
+
+    texts = list(texts)
+    if not texts:
+        return []
+    batch_size = batch_size or config.CLASSIFIER_BATCH_SIZE
+    classifier = classifier or get_classifier()
+    tokenizer, model = classifier.tokenizer, classifier.model
+    contradiction_id, entailment_id = _nli_label_ids(model)
+
+    chunked = [chunk_text(text, tokenizer, config.CLASSIFIER_CHUNK_TOKENS) for text in texts]
+    chunks = [chunk for text_chunks in chunked for chunk, _ in text_chunks]
+    hypotheses = [HYPOTHESIS_TEMPLATE.format(label) for label in CANDIDATE_LABELS]
+    pairs = [(c, h) for c in chunks for h in hypotheses]
+    for text_chunks in chunked:
+        metrics.observe("tokens", sum(tokens for _, tokens in text_chunks), model="classifier")
+        metrics.observe("chunks", len(text_chunks), buckets=(1, 2, 4, 8, 16, 32, 64), model="classifier")
+    # Group pairs of similar length together to keep padding small
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]))
+    probs = [0.0] * len(pairs)
+
+    with torch.inference_mode(), metrics.span("model", model="classifier"):
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = tokenizer(
+                [pairs[i][0] for i in idx],
+                [pairs[i][1] for i in idx],
+                padding=True,
+                truncation="only_first",
+                return_tensors="pt",
+            ).to(model.device)
+            logits = model(**inputs).logits[:, [contradiction_id, entailment_id]]
+            entail = logits.softmax(dim=-1)[:, 1].tolist()
+            for i, p in zip(idx, entail):
+                probs[i] = p
+
+    results = []
+    n_labels = len(CANDIDATE_LABELS)
+    pos = 0
+    for text_chunks in chunked:
+        chunk_scores = []
+        for _ in text_chunks:
+            chunk_scores.append(dict(zip(CANDIDATE_LABELS, probs[pos * n_labels:(pos + 1) * n_labels])))
+            pos += 1
+        label_scores = aggregate_scores(chunk_scores, [tokens for _, tokens in text_chunks])
+        ranked = sorted(label_scores.items(), key=lambda kv: kv[1], reverse=True)
+        results.append({
+            "label": ranked[0][0],
+            "score": ranked[0][1],
+            "scores": dict(ranked)
+        })
+    return results
+
+
+class MicroBatcher:
+    # Collects concurrent single-text requests for a few milliseconds and
+    # sends them through classify_texts together.
+    def __init__(self, wait_ms=None, max_texts=None):
+        self.wait = (wait_ms if wait_ms is not None else config.CLASSIFIER_MICROBATCH_WAIT_MS) / 1000.0
+        self.max_texts = max_texts or config.CLASSIFIER_MICROBATCH_MAX_TEXTS
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="classifier-microbatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def classify(self, text):
+        return self.submit(text).result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_texts:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = classify_texts([text for text, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_micro_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher()
+        return _batcher
 
-# This will download and cache the BART MNLI model if not already present.
-classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
 
 def classify_text(text):
-    candidate_labels = [
-        "Legitimate Job Offer",
-        "Phishing/Scam Email",
-        "Spam/Promotional Content"
-    ]
-    result = classifier(text, candidate_labels, multi_label=True)
-    # Get the main label and confidence
-    top_label = result["labels"][0]
-    top_score = result["scores"][0]
-    # Dict of all scores
-    label_scores = dict(zip(result["labels"], result["scores"]))
-    return {
-        "label": top_label,
-        "score": top_score,
-        "scores": label_scores
-    }
+    if config.CLASSIFIER_MICROBATCH:
+        return get_micro_batcher().classify(text)
+    return classify_texts([text])[0]
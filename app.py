@@ -1,14 +1,11 @@
 import streamlit as st
-import re
-import time
 
-# Assume supporting modules exist for complex operations (AI model, etc.)
-from ai_model import classify_text  # zero-shot classification model
-from rules import red_flag_rules, evaluate_text    # list or dict of regex patterns for heuristic flags
-from similarity import compute_similarity  # function to compute similarity score and roles
-from grammar import grammar_check   # function to get grammar score and issues
-from ner import get_entities        # function to extract named entities (ORG, PERSON)
-from verification import check_email_domain, check_link  # functions to verify domains and links
+import metrics
+import model_registry
+# The analysis itself lives in pipeline.py; stages run concurrently and report back as they finish.
+# incremental.py memoizes it so re-analyzing an edited message only redoes what changed.
+from incremental import StageMemo, run_incremental
+from pipeline import local_models
 
 # ---- Page Configuration ----
 st.set_page_config(
@@ -65,6 +62,29 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Start loading the models in the background once per server process (not on every rerun)
+@st.cache_resource
+def start_model_warmup():
+    return model_registry.warmup(local_models(), background=True)
+
+
+start_model_warmup()
+
+
+# Metrics sink / Prometheus endpoint, once per server process
+@st.cache_resource
+def start_metrics():
+    metrics.configure()
+
+
+start_metrics()
+
+
+# Stage results keyed on content hashes, shared by all sessions of this server process
+@st.cache_resource
+def get_stage_memo():
+    return StageMemo()
+
 # ---- Title and Instructions ----
 st.title("🔎 AI Scam Detector – Job Offer Analyzer")
 st.write("Paste the content of a job offer email or message below, and click **Analyze**. The app will run a multi-step AI detection pipeline to assess if the offer is likely **legitimate** or a **scam**, highlighting key findings for you.")
@@ -77,117 +97,62 @@ if st.button("Analyze"):
     if not user_input.strip():
         st.warning("Please enter the text of the job offer or email to analyze.")
     else:
-        # Run the multi-layer analysis pipeline with spinners for each stage
-        # 1. Rule-based heuristic analysis
-        with st.spinner("Scanning for red flags..."):
-            flags_found = []
-            highlighted_text = user_input
-            for rule, pattern in red_flag_rules.items():
-                # Assume red_flag_rules is a dict of {"rule_name": regex_pattern}
-                if re.search(pattern, user_input, flags=re.IGNORECASE):
-                    flags_found.append(rule)
-                    # highlight the matching part in the text
-                    highlighted_text = re.sub(pattern, 
-                                               lambda m: f"<span class='red-highlight'>{m.group(0)}</span>", 
-                                               highlighted_text, flags=re.IGNORECASE)
-            time.sleep(0.2)  # slight pause for spinner visualization
-        
-        # 2. AI zero-shot classification
-        with st.spinner("Running AI content classification..."):
-            # This function returns a dict, e.g. {"label": "Legitimate Job Offer", "score": 0.805, "scores": {"Legitimate Job Offer":0.805, "Phishing/Scam Email":0.060, "Spam":0.135}}
-            clf_result = classify_text(user_input)  
-            ai_label = clf_result.get("label", "Unknown")
-            ai_confidence = clf_result.get("score", 0.0)
-            # Prepare other label scores for display
-            other_labels = {lbl: sc for lbl, sc in clf_result.get("scores", {}).items() if lbl != ai_label}
-            time.sleep(0.2)
-        
-        # 3. Link and email domain checks
-        with st.spinner("Verifying email domains and links..."):
-            email_warnings = []
-            link_warnings = []
-            # Check all email addresses in text
-            emails = re.findall(r'[\w\.-]+@[\w\.-]+\.\w+', user_input)
-            for email in set(emails):
-                issue = check_email_domain(email)  # e.g. returns warning string if domain is free or suspicious, else None
-                if issue:
-                    email_warnings.append(f"**Email:** {email} – {issue}")
-            # Check all URLs in text
-            urls = re.findall(r'(https?://\S+)', user_input)
-            for url in set(urls):
-                issue = check_link(url)  # returns warning string if link is suspicious, else None
-                if issue:
-                    link_warnings.append(f"**Link:** {url} – {issue}")
-            time.sleep(0.2)
-        
-        # 4. Named entity recognition for org/person
-        with st.spinner("Extracting entities for consistency check..."):
-            entities = get_entities(user_input)  # e.g. {"ORG": ["Acme Corporation"], "PERSON": ["John Doe"]}
-            mismatch_warnings = []
-            # If an ORG is mentioned and an email warning exists about a different domain, flag it
-            if entities.get("ORG"):
-                for org in entities["ORG"]:
-                    # simple check: does org name appear in any email domain?
-                    org_name = org.lower().replace(",", "")
-                    match_found = any(org_name in email.split("@")[1].lower() for email in emails)
-                    if not match_found and emails:
-                        mismatch_warnings.append(f"Organization **{org}** is mentioned, but sender's email domain doesn’t match **{org}**.")
-            # (Additional logic could compare person names to email username, etc.)
-            time.sleep(0.1)
-        
-        # 5. Grammar and spelling analysis
-        with st.spinner("Analyzing grammar and writing quality..."):
-            grammar_score, issues = grammar_check(user_input)  # returns a score (0-100) and count of issues or list of issues
-            if isinstance(issues, list):
-                issue_count = len(issues)
+        # Run the multi-layer analysis pipeline; each stage reports back as soon as it finishes
+        stage_labels = {
+            "rules": "Scanning for red flags",
+            "extraction": "Extracting email addresses and links",
+            "embedding": "Embedding the message",
+            "classifier": "Running AI content classification",
+            "links": "Verifying email domains and links",
+            "entities": "Extracting entities for consistency check",
+            "mismatch": "Checking entity consistency",
+            "grammar": "Analyzing grammar and writing quality",
+            "similarity": "Comparing with real job offer patterns",
+        }
+        progress = st.empty()
+        finished = []
+
+        def show_stage(name, output, status, seconds):
+            icon = "♻️" if status in ("cached", "partial") else "✅" if status == "ok" else "⚠️"
+            if status == "ok":
+                note = ""
+            elif status == "cached":
+                note = " (unchanged, reused from the previous analysis)"
+            elif status == "partial":
+                note = " (re-run on the edited paragraphs only)"
             else:
-                issue_count = issues  # assume it's a count if not list
-            time.sleep(0.1)
-        
-        # 6. Structural similarity to real job offers
-        with st.spinner("Comparing with real job offer patterns..."):
-            similarity_pct, matched_roles = compute_similarity(user_input)  # returns similarity percentage and list of role titles
-            time.sleep(0.1)
-        
-        score = 0
-        reasons = []
+                note = f" ({status}, result left out of the score)"
+            finished.append(f"{icon} {stage_labels.get(name, name)} – {seconds:.1f}s{note}")
+            progress.markdown("  \n".join(finished))
 
-        if flags_found: 
-            score += min(15, 5 * len(flags_found))  # Cap flag penalty at 15
-            for flag in flags_found:
-                reasons.append(f"Red flag: {flag}")
+        with st.spinner("Running the multi-layer analysis..."):
+            result = run_incremental(user_input, memo=get_stage_memo(), on_stage=show_stage)
 
-        if email_warnings:
-            score += min(10, 5 * len(email_warnings))  # Cap at 10
-            for warn in email_warnings:
-                reasons.append(f"Email warning: {warn}")
+        outputs = result["outputs"]
+        flags_found = outputs["rules"]["flags"]
+        highlighted_text = outputs["rules"]["highlighted"]
 
-        if link_warnings:
-            score += min(10, 5 * len(link_warnings))  # Cap at 10
-            for warn in link_warnings:
-                reasons.append(f"Link warning: {warn}")
+        clf_result = outputs["classifier"]
+        ai_label = clf_result.get("label", "Unknown")
+        ai_confidence = clf_result.get("score", 0.0)
+        # Prepare other label scores for display
+        other_labels = {lbl: sc for lbl, sc in clf_result.get("scores", {}).items() if lbl != ai_label}
 
-        if mismatch_warnings:
-            score += 5
-            for warn in mismatch_warnings:
-                reasons.append(f"Entity mismatch: {warn}")
+        email_warnings = outputs["links"]["email_warnings"]
+        link_warnings = outputs["links"]["link_warnings"]
+        mismatch_warnings = outputs["mismatch"]["warnings"]
 
-        scam_confidence = clf_result["scores"].get("Phishing/Scam Email", 0)
-        score += int(scam_confidence * 60)  # Cap AI model effect at 60
+        grammar_result = outputs["grammar"] or {"score": 100, "issues": []}
+        grammar_score = grammar_result["score"]
+        issues = grammar_result["issues"]
+        issue_count = len(issues) if isinstance(issues, list) else issues
 
-        if grammar_score < 60:
-            score += 5  # Small penalty
+        similarity_result = outputs["similarity"] or {"score": 0.0, "matches": []}
+        similarity_pct = similarity_result["score"]
+        matched_roles = similarity_result["matches"]
 
-        if similarity_pct < 20:
-            score += 10  # Only if really low
-
-        final_score = min(100, max(0, score))
-        if final_score >= 60:
-            verdict = "Likely Scam"
-        elif final_score >= 40:
-            verdict = "Suspicious"
-        else:
-            verdict = "Likely Legitimate"
+        final_score = result["score"]
+        verdict = result["verdict"]
 
 
         # ---- Display Results ----
@@ -263,21 +228,34 @@ if st.button("Analyze"):
         
         # Grammar Quality Section
         st.subheader("✍️ Grammar & Writing Quality")
-        grade = "Good" if grammar_score > 80 else "Fair" if grammar_score > 50 else "Poor"
-        st.write(f"**Writing Quality:** {grade} (Grammar score: {grammar_score:.0f}%, Issues detected: {issue_count})")
-        if grade != "Good" and issue_count:
-            st.write("*Note: Scam emails often contain spelling or grammar mistakes, which is a potential warning sign.*")
+        if result["status"].get("grammar") == "skipped":
+            st.write("ℹ️ Skipped – the verdict was already settled by the other checks.")
+        else:
+            grade = "Good" if grammar_score > 80 else "Fair" if grammar_score > 50 else "Poor"
+            st.write(f"**Writing Quality:** {grade} (Grammar score: {grammar_score:.0f}%, Issues detected: {issue_count})")
+            if grade != "Good" and issue_count:
+                st.write("*Note: Scam emails often contain spelling or grammar mistakes, which is a potential warning sign.*")
         
         # Structural Similarity Section
         st.subheader("📄 Structural Similarity to Real Job Offers")
-        col_sim, col_role = st.columns([1, 2])
-        with col_sim:
-            st.metric(label="Similarity Score", value=f"{similarity_pct:.0f} %")
-        with col_role:
-            # Defensive: Only join if matched_roles is a list/tuple and not empty
-            if matched_roles and isinstance(matched_roles, (list, tuple)) and len(matched_roles) > 0:
-                st.write(f"**Possible Matched Job Role(s):** {', '.join(map(str, matched_roles))}")
-            else:
-                st.write("**Possible Matched Job Role(s):** Not clearly identified")
+        if result["status"].get("similarity") == "skipped":
+            st.write("ℹ️ Skipped – the verdict was already settled by the other checks.")
+        else:
+            col_sim, col_role = st.columns([1, 2])
+            with col_sim:
+                st.metric(label="Similarity Score", value=f"{similarity_pct:.0f} %")
+            with col_role:
+                # Defensive: Only join if matched_roles is a list/tuple and not empty
+                if matched_roles and isinstance(matched_roles, (list, tuple)) and len(matched_roles) > 0:
+                    roles = [f"{m['role']} ({m['score']:.0f}%)" if isinstance(m, dict) else str(m) for m in matched_roles]
+                    st.write(f"**Possible Matched Job Role(s):** {', '.join(roles)}")
+                else:
+                    st.write("**Possible Matched Job Role(s):** Not clearly identified")
 
         st.caption("*(Similarity indicates how closely the message resembles a typical job offer. Low similarity or no clear role may suggest an unusual/scam message.)*")
+
+        with st.expander("⏱️ Stage and model timings"):
+            st.write({name: f"{seconds:.2f}s ({result['status'][name]})" for name, seconds in result["timings"].items()})
+            st.write({name: f"{reused}/{needed} reused" for name, (reused, needed) in result["reuse"].items()})
+            st.write(get_stage_memo().stats())
+            st.write(model_registry.report())
@@ -0,0 +1,192 @@
+# backends.py
+
+# Builds the transformer stages for the configured inference backend:
+#   fp32  the reference PyTorch models
+#   int8  the same weights with every nn.Linear dynamically quantized to int8
+#   onnx  an ONNX Runtime export (int8-quantized for the classifier), built once
+#         from the locally cached weights and kept under CACHE_DIR
+# check_accuracy() compares a backend against fp32 on a held-out set:
+#   python backends.py check --backend int8 --data heldout.jsonl
+import argparse
+import json
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import config
+
+BACKENDS = ("fp32", "int8", "onnx")
+
+_threads_configured = False
+_threads_lock = threading.Lock()
+
+
+def configure_threads():
+    # Apply the intra/inter-op thread settings once, before the first model runs
+    global _threads_configured
+    with _threads_lock:
+        if _threads_configured:
+            return
+        _threads_configured = True
+        try:
+            import torch
+        except ImportError:
+            # ONNX-only install; the sessions get their threads from _session_options
+            return
+
+        if config.TORCH_INTRA_OP_THREADS:
+            torch.set_num_threads(config.TORCH_INTRA_OP_THREADS)
+        if config.TORCH_INTER_OP_THREADS:
+            try:
+                torch.set_num_interop_threads(config.TORCH_INTER_OP_THREADS)
+            except RuntimeError:
+                # Only allowed before any inter-op work has started
+                pass
+
+
+def _session_options():
+    # ONNX Runtime keeps its own thread pools, so the same settings go in per session
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if config.TORCH_INTRA_OP_THREADS:
+        options.intra_op_num_threads = config.TORCH_INTRA_OP_THREADS
+    if config.TORCH_INTER_OP_THREADS:
+        options.inter_op_num_threads = config.TORCH_INTER_OP_THREADS
+    return options
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def _quantize(module):
+    import torch
+
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_dir(model_name):
+    return os.path.join(config.CACHE_DIR, "onnx", model_name.replace("/", "--"))
+
+
+def load_classifier(backend=None):
+    # Returns an object with .tokenizer and .model, as ai_model.classify_texts expects
+    backend = backend or config.INFERENCE_BACKEND
+    _check_backend(backend)
+    configure_threads()
+    from transformers import AutoTokenizer, pipeline
+
+    if backend != "onnx":
+        # This will download and cache the BART MNLI model if not already present.
+        classifier = pipeline("zero-shot-classification", model=config.CLASSIFIER_MODEL)
+        if backend == "int8":
+            classifier.model = _quantize(classifier.model.eval())
+        return classifier
+
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    export_dir = _onnx_dir(config.CLASSIFIER_MODEL)
+    quantized_file = "model_quantized.onnx"
+    if not os.path.exists(os.path.join(export_dir, quantized_file)):
+        exported = ORTModelForSequenceClassification.from_pretrained(config.CLASSIFIER_MODEL, export=True)
+        exported.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(config.CLASSIFIER_MODEL).save_pretrained(export_dir)
+        quantizer = ORTQuantizer.from_pretrained(export_dir)
+        quantizer.quantize(
+            save_dir=export_dir,
+            quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False),
+        )
+    model = ORTModelForSequenceClassification.from_pretrained(
+        export_dir, file_name=quantized_file, session_options=_session_options()
+    )
+    return SimpleNamespace(tokenizer=AutoTokenizer.from_pretrained(export_dir), model=model)
+
+
+def load_embedder(backend=None):
+    backend = backend or config.INFERENCE_BACKEND
+    _check_backend(backend)
+    configure_threads()
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        # sentence-transformers exports and caches the ONNX model itself
+        return SentenceTransformer(
+            config.SIMILARITY_MODEL, backend="onnx", model_kwargs={"session_options": _session_options()}
+        )
+    model = SentenceTransformer(config.SIMILARITY_MODEL)
+    if backend == "int8":
+        model = _quantize(model.eval())
+    return model
+
+
+# ---- Accuracy check ----
+
+DEFAULT_HELDOUT = [
+    "Dear Jane Doe, thank you for applying to ABC Corp. We are pleased to offer you an interview "
+    "for the Data Analyst position in our New York office. Please let us know a suitable time.",
+    "We are urgently looking to fill a data entry position and need your response within 24 hours. "
+    "Please send your bank account details and a copy of your ID card for verification.",
+    "Congratulations! You've been selected for a customer support role. Pay the $50 training fee "
+    "in gift cards to secure your spot.",
+    "Hi, following our call, attached is the offer letter for the Software Engineer role. "
+    "HR will reach out about onboarding and benefits next week.",
+    "Earn $5000 a week from home! Limited time offer, click the link to claim your bonus now.",
+]
+
+
+def load_heldout(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+def check_accuracy(backend, texts=None):
+    # Runs the fp32 reference and `backend` side by side on `texts`
+    import numpy as np
+
+    from ai_model import classify_texts
+    from similarity import _encode
+
+    texts = texts or DEFAULT_HELDOUT
+    reference = classify_texts(texts, classifier=load_classifier("fp32"))
+    candidate = classify_texts(texts, classifier=load_classifier(backend))
+    label_agreement = np.mean([r["label"] == c["label"] for r, c in zip(reference, candidate)])
+    score_diffs = [
+        abs(r["scores"][label] - c["scores"][label])
+        for r, c in zip(reference, candidate)
+        for label in r["scores"]
+    ]
+
+    ref_embs = _encode(texts, model=load_embedder("fp32"))
+    cand_embs = _encode(texts, model=load_embedder(backend))
+    cosines = np.sum(ref_embs * cand_embs, axis=1)
+
+    return {
+        "backend": backend,
+        "texts": len(texts),
+        "classifier_label_agreement": float(label_agreement),
+        "classifier_max_score_diff": float(max(score_diffs)),
+        "classifier_mean_score_diff": float(np.mean(score_diffs)),
+        "embedding_min_cosine": float(cosines.min()),
+        "embedding_mean_cosine": float(cosines.mean()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference backend tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="compare a backend against the fp32 reference")
+    check.add_argument("--backend", choices=BACKENDS, default="int8")
+    check.add_argument("--data", default=None, help="held-out JSONL file with a 'text' field per line")
+    args = parser.parse_args(argv)
+
+    texts = load_heldout(args.data) if args.data else None
+    json.dump(check_accuracy(args.backend, texts), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# batch_scan.py
+
+# Headless batch mode: streams messages from an mbox file, a directory of .eml
+# files or a JSONL file, scores them on a process pool (models are loaded once
+# per worker) and appends verdicts to a JSONL or CSV file as they complete.
+# Progress is checkpointed so an interrupted run can be resumed with --resume.
+#
+#   python batch_scan.py inbox.mbox -o verdicts.jsonl --workers 4
+#   python batch_scan.py exported_emails/ -o verdicts.csv --resume
+import argparse
+import csv
+import email
+import email.policy
+import json
+import mailbox
+import multiprocessing
+import os
+import re
+import signal
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util
+
+CSV_FIELDS = ["id", "score", "verdict", "reasons", "cache_hit", "degraded"]
+
+
+# ---- Input readers (all lazy) ----
+# Each yields (message id, text). `skip` drops the first messages without
+# reading or parsing them (for --resume). A message that can't be read or
+# parsed is yielded as (message id, exception), so it gets an error record and
+# the checkpoint still moves past it.
+
+def message_to_text(msg):
+    # Headers that matter for scoring plus the plain-text body (HTML is stripped as a fallback)
+    parts = []
+    for header in ("From", "Reply-To", "Subject"):
+        if msg.get(header):
+            parts.append(f"{header}: {msg.get(header)}")
+    body = None
+    html_body = None
+    for part in msg.walk() if msg.is_multipart() else [msg]:
+        if part.get_content_maintype() != "text" or part.get_filename():
+            continue
+        try:
+            payload = part.get_content()
+        except (LookupError, KeyError, AttributeError):
+            raw = part.get_payload(decode=True) or b""
+            payload = raw.decode("utf-8", errors="replace")
+        if part.get_content_subtype() == "plain" and body is None:
+            body = payload
+        elif part.get_content_subtype() == "html" and html_body is None:
+            html_body = re.sub(r"<[^>]+>", " ", payload)
+    parts.append("")
+    parts.append(body if body is not None else (html_body or ""))
+    return "\n".join(parts)
+
+
+def iter_mbox(path, skip=0):
+    box = mailbox.mbox(path, factory=lambda f: email.message_from_binary_file(f, policy=email.policy.default), create=False)
+    for key in list(box.iterkeys())[skip:]:
+        message_id = f"{os.path.basename(path)}:{key}"
+        try:
+            msg = box[key]
+            message_id = msg.get("Message-ID") or message_id
+            text = message_to_text(msg)
+        except Exception as exc:
+            text = exc
+        yield message_id, text
+
+
+def iter_eml_dir(path, skip=0):
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(".eml"):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            full = os.path.join(root, name)
+            try:
+                with open(full, "rb") as f:
+                    msg = email.message_from_binary_file(f, policy=email.policy.default)
+                text = message_to_text(msg)
+            except Exception as exc:
+                text = exc
+            yield os.path.relpath(full, path), text
+
+
+def iter_jsonl(path, text_field="text", id_field="id", skip=0):
+    # Binary, so a line that isn't valid UTF-8 only spoils that line
+    with open(path, "rb") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            if skip:
+                skip -= 1
+                continue
+            message_id = str(lineno)
+            try:
+                record = json.loads(line.decode("utf-8"))
+                message_id = str(record.get(id_field, lineno))
+                text = record[text_field]
+                if not isinstance(text, str):
+                    raise TypeError(f"{text_field!r} is {type(text).__name__}, not a string")
+            except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                text = exc
+            yield message_id, text
+
+
+def iter_messages(path, text_field="text", id_field="id", skip=0):
+    if os.path.isdir(path):
+        return iter_eml_dir(path, skip)
+    if path.endswith(".jsonl"):
+        return iter_jsonl(path, text_field, id_field, skip)
+    return iter_mbox(path, skip)
+
+
+# ---- Workers ----
+
+def _stop_worker(signum, frame):
+    from grammar import close_pool
+
+    close_pool()
+    os._exit(0)
+
+
+def _init_worker(workers, worker_counter):
+    import backends
+    import config
+    import metrics
+    import model_registry
+    from grammar import close_pool
+
+    # Pool workers exit through os._exit, which skips atexit: close this
+    # worker's LanguageTool servers on a normal shutdown and on SIGTERM
+    util.Finalize(None, close_pool, exitpriority=10)
+    signal.signal(signal.SIGTERM, _stop_worker)
+
+    # Each worker serves its own metrics on the next free port after the parent's
+    with worker_counter.get_lock():
+        index = worker_counter.value
+        worker_counter.value += 1
+    metrics.configure(port=metrics.worker_port(index))
+
+    # Split the cores between the workers instead of letting each one start a
+    # thread per core (PyTorch now, ONNX Runtime sessions as they're created)
+    config.TORCH_INTRA_OP_THREADS = config.TORCH_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    backends.configure_threads()
+    # Load the models once per worker process, before the first message
+    # arrives. LanguageTool (a Java server per worker) starts on the first
+    # grammar check instead, since cascaded runs often never need it.
+    from pipeline import local_models
+
+    model_registry.warmup([name for name in local_models() if name != "grammar"])
+
+
+def analyze_message(item):
+    from pipeline import run_pipeline
+
+    message_id, text = item
+    result = run_pipeline(text)
+    return {
+        "id": message_id,
+        "score": result["score"],
+        "verdict": result["verdict"],
+        "reasons": result["reasons"],
+        "cache_hit": result["cache_hit"],
+        "degraded": sorted(name for name, status in result["status"].items() if status not in ("ok", "cached")),
+        "features": result["features"],
+        "cascade": result["cascade"],
+    }
+
+
+def _submit(executor, item):
+    message_id, text = item
+    if isinstance(text, Exception):
+        # Unreadable input: fail in place, so it's written (in order) as an error record
+        future = Future()
+        future.set_exception(text)
+        return future
+    return executor.submit(analyze_message, item)
+
+
+def error_record(message_id, exc):
+    # Written in place of a verdict when a message could not be analyzed
+    return {
+        "id": message_id,
+        "score": None,
+        "verdict": "Error",
+        "reasons": [f"{type(exc).__name__}: {exc}"],
+        "cache_hit": False,
+        "degraded": [],
+        "features": None,
+        "cascade": None,
+    }
+
+
+# ---- Output + checkpointing ----
+
+class ResultWriter:
+    def __init__(self, path, offset=None):
+        self.format = "csv" if path.endswith(".csv") else "jsonl"
+        exists = os.path.exists(path)
+        self._file = open(path, "a+" if exists else "w", encoding="utf-8", newline="")
+        if offset is not None:
+            # Drop anything written after the last checkpoint
+            self._file.truncate(offset)
+        self._file.seek(0, os.SEEK_END)
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if self._file.tell() == 0:
+                self._csv.writeheader()
+
+    def write(self, record):
+        if self.format == "csv":
+            row = dict(record)
+            # Features are only kept in JSONL output (for `python verdict.py rescore`)
+            row.pop("features", None)
+            row.pop("cascade", None)
+            row["reasons"] = " | ".join(record["reasons"])
+            row["degraded"] = ",".join(record["degraded"])
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def scan(input_path, output_path, workers=None, checkpoint_path=None, resume=False,
+         checkpoint_every=100, max_in_flight=None, text_field="text", id_field="id"):
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    state = load_checkpoint(checkpoint_path) if resume else None
+    if state and state.get("input") != os.path.abspath(input_path):
+        raise SystemExit(f"Checkpoint {checkpoint_path} belongs to {state.get('input')}, not {input_path}")
+    done = state["processed"] if state else 0
+    if not state and os.path.exists(output_path):
+        os.remove(output_path)
+
+    writer = ResultWriter(output_path, offset=state["offset"] if state else None)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    # Skip what an earlier run already wrote
+    messages = iter_messages(input_path, text_field, id_field, skip=done)
+
+    from pipeline import CascadeStats
+
+    # The workers' own stats die with them, so tally the cascade from the records
+    stats = CascadeStats(publish=False)
+    pending = deque()
+    since_checkpoint = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(workers, multiprocessing.Value("i", 0))) as executor:
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a bounded window of work in flight so memory stays flat
+                while not exhausted and len(pending) < max_in_flight:
+                    item = next(messages, None)
+                    if item is None:
+                        exhausted = True
+                    else:
+                        pending.append((item[0], _submit(executor, item)))
+                if not pending:
+                    break
+                # Results are written in input order so the checkpoint is a simple count
+                message_id, future = pending.popleft()
+                try:
+                    record = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as exc:
+                    # One bad message shouldn't abort the scan
+                    print(f"Failed to analyze {message_id}: {exc!r}", file=sys.stderr)
+                    record = error_record(message_id, exc)
+                if record.get("cascade"):
+                    stats.record(**record["cascade"])
+                writer.write(record)
+                done += 1
+                since_checkpoint += 1
+                if since_checkpoint >= checkpoint_every:
+                    save_checkpoint(checkpoint_path, {
+                        "input": os.path.abspath(input_path),
+                        "processed": done,
+                        "offset": writer.flush(),
+                    })
+                    since_checkpoint = 0
+    finally:
+        save_checkpoint(checkpoint_path, {
+            "input": os.path.abspath(input_path),
+            "processed": done,
+            "offset": writer.flush(),
+        })
+        writer.close()
+        if stats.runs:
+            print(format_cascade_report(stats.report()), file=sys.stderr)
+    return done
+
+
+def format_cascade_report(report):
+    lines = [
+        f"Cascade: {report['early_exits']}/{report['runs']} message(s) exited early, "
+        f"{report['skip_rate']:.0%} of skippable stages skipped"
+    ]
+    if report["skipped"]:
+        lines.append("  skipped: " + ", ".join(f"{name} {count}" for name, count in sorted(report["skipped"].items())))
+    if report["audits"]:
+        lines.append(f"  audits: {report['audits']}, verdict unchanged in {report['audit_agreement']:.0%}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a mailbox export for job-offer scams.")
+    parser.add_argument("input", help="mbox file, directory of .eml files, or .jsonl file")
+    parser.add_argument("-o", "--output", required=True, help="output file (.jsonl or .csv)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="messages between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--text-field", default="text", help="JSONL field holding the message text")
+    parser.add_argument("--id-field", default="id", help="JSONL field holding the message id")
+    args = parser.parse_args(argv)
+
+    import metrics
+
+    metrics.configure()
+    count = scan(
+        args.input,
+        args.output,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
+        text_field=args.text_field,
+        id_field=args.id_field,
+    )
+    print(f"Scanned {count} message(s) -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
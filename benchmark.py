@@ -0,0 +1,247 @@
+# benchmark.py
+
+# Reproducible benchmark for the detection pipeline. Each stage is timed on a
+# synthetic, seeded corpus (see corpus.py): the first call is reported as the
+# cold latency (it includes lazy model loading) and the rest as warm latency.
+# Every stage runs in a fresh process, so its cold latency and peak RSS don't
+# depend on which stages ran before it (stages share models and caches, e.g.
+# spaCy and the domain index). --in-process runs them all in one process,
+# where cold numbers only mean something for the first stage to load a model.
+# WHOIS is served by a local fake so network noise doesn't leak into results.
+#
+#   python benchmark.py run --messages 200 --seed 0 --out bench.json
+#   python benchmark.py run --stages rules,links,final_score
+#   python benchmark.py compare old.json new.json --threshold 10
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from corpus import generate_corpus
+
+STAGE_NAMES = ["rules", "classify", "links", "entities", "grammar", "similarity", "final_score"]
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _stage_functions(domain_ages, whois_delay):
+    # name -> fn(text); imports happen here so importing the benchmark stays cheap
+    def rules_stage(text):
+        from rules import evaluate_text
+        return evaluate_text(text)
+
+    def classify_stage(text):
+        from ai_model import classify_text
+        return classify_text(text)
+
+    resolver = None
+
+    def links_stage(text):
+        nonlocal resolver
+        from link_analysis import analyze_links_and_emails
+        from whois_cache import DomainAgeCache, DomainAgeResolver, make_static_lookup
+        if resolver is None:
+            resolver = DomainAgeResolver(
+                lookup=make_static_lookup(domain_ages, delay=whois_delay),
+                cache=DomainAgeCache(),
+            )
+        return analyze_links_and_emails(text, resolver=resolver)
+
+    def entities_stage(text):
+        from ner import get_entities
+        return get_entities(text)
+
+    def grammar_stage(text):
+        from grammar import grammar_check
+        return grammar_check(text)
+
+    def similarity_stage(text):
+        from similarity import compute_similarity
+        return compute_similarity(text)
+
+    def final_score_stage(text):
+        from verdict import score_batch
+        # Deterministic stand-in features derived from the text so the call isn't constant-folded
+        n = len(text)
+        return score_batch([[n % 4, n % 3, n % 2, n % 2, (n % 100) / 100, (n * 7) % 100, (n * 13) % 100]])
+
+    return {
+        "rules": rules_stage,
+        "classify": classify_stage,
+        "links": links_stage,
+        "entities": entities_stage,
+        "grammar": grammar_stage,
+        "similarity": similarity_stage,
+        "final_score": final_score_stage,
+    }
+
+
+def bench_stage(fn, texts):
+    start = time.perf_counter()
+    fn(texts[0])
+    cold = time.perf_counter() - start
+
+    # The first message was the cold call; don't time it again warm
+    warm_texts = texts[1:] or texts
+    latencies = []
+    total_start = time.perf_counter()
+    for text in warm_texts:
+        start = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - start)
+    total = time.perf_counter() - total_start
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        "cold_ms": ms(cold),
+        "p50_ms": ms(_percentile(latencies, 50)),
+        "p95_ms": ms(_percentile(latencies, 95)),
+        "p99_ms": ms(_percentile(latencies, 99)),
+        "mean_ms": ms(total / len(warm_texts)),
+        "messages_per_second": round(len(warm_texts) / total, 2) if total else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _bench_fresh(name, messages, seed, whois_delay, max_sentences):
+    # Runs in a spawned process; the corpus is seeded, so it's the same one
+    corpus, domain_ages = generate_corpus(messages, seed=seed, max_sentences=max_sentences)
+    texts = [m["text"] for m in corpus]
+    return bench_stage(_stage_functions(domain_ages, whois_delay)[name], texts)
+
+
+def run(stages, messages=200, seed=0, whois_delay=0.0, max_sentences=40, in_process=False):
+    corpus, domain_ages = generate_corpus(messages, seed=seed, max_sentences=max_sentences)
+    texts = [m["text"] for m in corpus]
+    functions = _stage_functions(domain_ages, whois_delay)
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "inference_backend": config.INFERENCE_BACKEND,
+            "messages": messages,
+            "seed": seed,
+            "mean_chars": round(sum(len(t) for t in texts) / len(texts), 1),
+            "whois_delay_ms": whois_delay * 1000,
+            "in_process": in_process,
+        },
+        "stages": {},
+    }
+    for name in stages:
+        print(f"benchmarking {name}...", file=sys.stderr)
+        if in_process:
+            results["stages"][name] = bench_stage(functions[name], texts)
+        else:
+            # spawn, not fork: a forked child would inherit whatever the parent loaded
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results["stages"][name] = executor.submit(
+                    _bench_fresh, name, messages, seed, whois_delay, max_sentences
+                ).result()
+    if in_process:
+        results["meta"]["peak_rss_mb"] = _peak_rss_mb()
+    else:
+        results["meta"]["peak_rss_mb"] = max((r["peak_rss_mb"] for r in results["stages"].values()), default=None)
+    return results
+
+
+def compare(old, new, threshold):
+    # Returns a list of (stage, metric, old, new, change_pct, regressed)
+    rows = []
+    lower_is_better = ["cold_ms", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "peak_rss_mb"]
+    for stage, new_metrics in new["stages"].items():
+        old_metrics = old["stages"].get(stage)
+        if old_metrics is None:
+            continue
+        for metric in lower_is_better + ["messages_per_second"]:
+            a, b = old_metrics.get(metric), new_metrics.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            worse = change > threshold if metric in lower_is_better else change < -threshold
+            rows.append((stage, metric, a, b, round(change, 1), worse))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scam detection pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="time each stage on a synthetic corpus")
+    run_p.add_argument("--messages", type=int, default=200)
+    run_p.add_argument("--seed", type=int, default=0)
+    run_p.add_argument("--max-sentences", type=int, default=40, help="longest generated message, in sentences")
+    run_p.add_argument("--stages", default=",".join(STAGE_NAMES), help="comma-separated subset of stages")
+    run_p.add_argument("--whois-delay-ms", type=float, default=0.0, help="simulated WHOIS latency")
+    run_p.add_argument("--in-process", action="store_true",
+                       help="run all stages in this process (faster; cold numbers then depend on stage order)")
+    run_p.add_argument("--out", default=None, help="write JSON results here (default: stdout)")
+
+    cmp_p = sub.add_parser("compare", help="diff two result files and flag regressions")
+    cmp_p.add_argument("old")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+        unknown = sorted(set(stages) - set(STAGE_NAMES))
+        if unknown:
+            parser.error(f"unknown stage(s): {', '.join(unknown)}")
+        results = run(stages, args.messages, args.seed, args.whois_delay_ms / 1000.0, args.max_sentences,
+                      in_process=args.in_process)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        return 0
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = 0
+    for stage, metric, a, b, change, worse in compare(old, new, args.threshold):
+        marker = "REGRESSION" if worse else ""
+        regressions += worse
+        print(f"{stage:<12} {metric:<20} {a:>12} -> {b:<12} {change:+7.1f}%  {marker}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
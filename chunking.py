@@ -0,0 +1,137 @@
+# chunking.py
+
+# Splits long messages into sentence-aligned chunks that fit a model's token
+# budget, so nothing past the context window is silently truncated. Quoted
+# replies, signatures and disclaimers are dropped first since they rarely
+# carry the scam payload and just cost compute - but only when they really
+# are boilerplate, so a payload hidden below a fake footer is still scored.
+import math
+import re
+
+import config
+
+_QUOTE_HEADER_RE = re.compile(
+    r"^\s*(on .{0,200} wrote:|-{2,}\s*original message\s*-{2,}|-{2,}\s*forwarded message\s*-{2,}|"
+    r"from:\s.+\s+sent:\s.+)\s*$",
+    re.IGNORECASE,
+)
+_SIGNOFF_RE = re.compile(r"^\s*(sent from my \w+.*|get outlook for \w+.*)\s*$", re.IGNORECASE)
+_DISCLAIMER_RE = re.compile(
+    r"^\s*(this (e-?mail|message)( and any (files|attachments).{0,40})? (is|are|may be) "
+    r"(confidential|intended solely)|confidentiality notice|disclaimer:)",
+    re.IGNORECASE,
+)
+# Sentence ends are [.!?] followed by whitespace or the end of the text, so
+# addresses, URLs and numbers like "3.5" stay in one piece
+_SENTENCE_RE = re.compile(r"[^\n]+?(?:[.!?]+(?=\s|$)|\n+|$)")
+_URL_RE = re.compile(r"https?://|www\.", re.IGNORECASE)
+_MONEY_RE = re.compile(
+    r"[$€£₹]\s?\d|\d[\d,.]*\s?(usd|eur|gbp|inr|rs\b|dollars|euros|pounds|rupees|lakhs?|k\b)",
+    re.IGNORECASE,
+)
+# A signature or legal footer longer than this isn't just a footer
+FOOTER_MAX_LINES = 15
+
+
+def _is_boilerplate(lines):
+    # Nothing a scam would need: no links, no amounts, no red flag
+    from rules import scan_text, triggered_rules
+
+    block = "\n".join(lines)
+    if _URL_RE.search(block) or _MONEY_RE.search(block):
+        return False
+    # Domain-list rules (free-mail senders etc.) fire on ordinary signatures
+    return not any("pattern" in rule for rule in triggered_rules(scan_text(block)))
+
+
+def prefilter(text):
+    lines = text.splitlines()
+    kept = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _QUOTE_HEADER_RE.match(line):
+            # Start of a quoted or forwarded thread
+            if _is_boilerplate(lines[i:]):
+                break
+        elif stripped == "--" or _DISCLAIMER_RE.match(line):
+            # Signature delimiter or legal footer: only dropped as the short tail of the message
+            if len(lines) - i <= FOOTER_MAX_LINES and _is_boilerplate(lines[i:]):
+                break
+        if stripped.startswith(">") or _SIGNOFF_RE.match(line):
+            continue
+        kept.append(line)
+    filtered = "\n".join(kept).strip()
+    # Never filter a message down to nothing
+    return filtered or text
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+
+
+def chunk_text(text, tokenizer, max_tokens):
+    # Returns [(chunk_text, token_count)]. Sentences are tokenized once, in one
+    # call, and packed greedily; a single sentence longer than the budget is
+    # cut into budget-sized token windows. Text that fits is passed through as is.
+    if config.CHUNK_PREFILTER:
+        text = prefilter(text)
+    whole = tokenizer([text], add_special_tokens=False)["input_ids"][0]
+    if len(whole) <= max_tokens:
+        return [(text, len(whole))]
+    sentences = split_sentences(text)
+    if not sentences:
+        return [(text, 0)]
+    token_ids = tokenizer(sentences, add_special_tokens=False)["input_ids"]
+
+    chunks = []
+    current, current_tokens = [], 0
+    for sentence, ids in zip(sentences, token_ids):
+        if len(ids) > max_tokens:
+            if current:
+                chunks.append((" ".join(current), current_tokens))
+                current, current_tokens = [], 0
+            for start in range(0, len(ids), max_tokens):
+                window = ids[start:start + max_tokens]
+                chunks.append((tokenizer.decode(window), len(window)))
+            continue
+        if current_tokens + len(ids) > max_tokens and current:
+            chunks.append((" ".join(current), current_tokens))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += len(ids)
+    if current:
+        chunks.append((" ".join(current), current_tokens))
+    return chunks
+
+
+def chunk_weights(values, token_counts, method, temperature=0.1):
+    # Weights for combining per-chunk values:
+    #   max        all weight on the highest value
+    #   mean       proportional to chunk length in tokens
+    #   attention  softmax over the values, so strong chunks dominate without ignoring the rest
+    n = len(values)
+    if n == 1:
+        return [1.0]
+    if method == "max":
+        best = max(range(n), key=lambda i: values[i])
+        return [1.0 if i == best else 0.0 for i in range(n)]
+    if method == "attention":
+        top = max(values)
+        exps = [math.exp((v - top) / temperature) for v in values]
+        total = sum(exps)
+        return [e / total for e in exps]
+    total = sum(token_counts)
+    if not total:
+        return [1.0 / n] * n
+    return [c / total for c in token_counts]
+
+
+def aggregate_scores(chunk_scores, token_counts, method=None):
+    # chunk_scores: one {label: score} dict per chunk -> one combined dict
+    method = method or config.CLASSIFIER_CHUNK_AGGREGATION
+    combined = {}
+    for label in chunk_scores[0]:
+        values = [scores[label] for scores in chunk_scores]
+        weights = chunk_weights(values, token_counts, method)
+        combined[label] = sum(w * v for w, v in zip(weights, values))
+    return combined
@@ -0,0 +1,198 @@
+# config.py
+
+# Central place for tunable settings. Every value can be overridden with an
+# environment variable so deployments don't need code changes.
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_set(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return set(default)
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+# ---- Grammar (LanguageTool) ----
+GRAMMAR_LANGUAGE = os.environ.get("SCAM_GRAMMAR_LANGUAGE", "en-US")
+# Number of LanguageTool servers kept alive in the process-wide pool
+GRAMMAR_POOL_SIZE = _env_int("SCAM_GRAMMAR_POOL_SIZE", 2)
+# Seconds to wait for a free LanguageTool instance before giving up
+GRAMMAR_ACQUIRE_TIMEOUT = _env_int("SCAM_GRAMMAR_ACQUIRE_TIMEOUT", 60)
+# Instances idle for longer than this many seconds are pinged (and restarted
+# if dead) when they are checked out again
+GRAMMAR_HEALTH_INTERVAL = _env_int("SCAM_GRAMMAR_HEALTH_INTERVAL", 300)
+# Categories that don't say much about scam-style writing (style nits, typography, ...)
+# are disabled so LanguageTool only runs the rules that feed the grammar score.
+GRAMMAR_DISABLED_CATEGORIES = _env_set("SCAM_GRAMMAR_DISABLED_CATEGORIES", [
+    "STYLE",
+    "TYPOGRAPHY",
+    "REDUNDANCY",
+    "PLAIN_ENGLISH",
+    "COLLOQUIALISMS",
+    "WIKIPEDIA",
+    "CREATIVE_WRITING",
+    "REPETITIONS_STYLE",
+    "GENDER_NEUTRALITY",
+])
+
+# ---- Caches ----
+# Where precomputed artifacts (embedding indexes, ...) are stored between runs
+CACHE_DIR = os.environ.get("SCAM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "scam_detector"))
+
+# ---- Similarity (SentenceTransformer) ----
+SIMILARITY_MODEL = os.environ.get("SCAM_SIMILARITY_MODEL", "all-MiniLM-L6-v2")
+# Optional external template set (.txt, .json or .jsonl); the built-in templates are used when unset
+SIMILARITY_TEMPLATES_PATH = os.environ.get("SCAM_SIMILARITY_TEMPLATES_PATH")
+# Number of closest templates returned (and averaged into the similarity score)
+SIMILARITY_TOP_K = _env_int("SCAM_SIMILARITY_TOP_K", 3)
+# Above this many templates an approximate (HNSW) index is used when faiss is installed
+SIMILARITY_ANN_THRESHOLD = _env_int("SCAM_SIMILARITY_ANN_THRESHOLD", 50000)
+
+# ---- Zero-shot classifier (BART-MNLI) ----
+CLASSIFIER_MODEL = os.environ.get("SCAM_CLASSIFIER_MODEL", "facebook/bart-large-mnli")
+# Number of (text, label) pairs per forward pass
+CLASSIFIER_BATCH_SIZE = _env_int("SCAM_CLASSIFIER_BATCH_SIZE", 16)
+# Gather concurrent single-text requests into one batch (0 = off)
+CLASSIFIER_MICROBATCH = _env_int("SCAM_CLASSIFIER_MICROBATCH", 0)
+# How long the micro-batcher waits for more requests, and the most texts it dispatches at once
+CLASSIFIER_MICROBATCH_WAIT_MS = _env_int("SCAM_CLASSIFIER_MICROBATCH_WAIT_MS", 5)
+CLASSIFIER_MICROBATCH_MAX_TEXTS = _env_int("SCAM_CLASSIFIER_MICROBATCH_MAX_TEXTS", 32)
+
+# ---- spaCy ----
+SPACY_MODEL = os.environ.get("SCAM_SPACY_MODEL", "en_core_web_sm")
+# Pipeline components we never use; only tok2vec + ner are needed for entities
+SPACY_EXCLUDE = sorted(_env_set("SCAM_SPACY_EXCLUDE", ["parser", "lemmatizer", "tagger", "attribute_ruler", "senter"]))
+SPACY_BATCH_SIZE = _env_int("SCAM_SPACY_BATCH_SIZE", 64)
+SPACY_N_PROCESS = _env_int("SCAM_SPACY_N_PROCESS", 1)
+
+# ---- WHOIS / domain age ----
+# SQLite file backing the domain-age cache (set to an empty string to keep it in memory only)
+WHOIS_CACHE_PATH = os.environ.get("SCAM_WHOIS_CACHE_PATH", os.path.join(CACHE_DIR, "whois.sqlite"))
+WHOIS_CACHE_SIZE = _env_int("SCAM_WHOIS_CACHE_SIZE", 10000)
+# Seconds a successful lookup stays valid, and how long failed lookups are remembered
+WHOIS_TTL = _env_int("SCAM_WHOIS_TTL", 7 * 24 * 3600)
+WHOIS_NEGATIVE_TTL = _env_int("SCAM_WHOIS_NEGATIVE_TTL", 3600)
+# Per-lookup timeout (seconds) and maximum number of lookups in flight
+WHOIS_TIMEOUT = float(os.environ.get("SCAM_WHOIS_TIMEOUT", "5"))
+WHOIS_MAX_CONCURRENCY = _env_int("SCAM_WHOIS_MAX_CONCURRENCY", 8)
+# Lookups allowed to be queued or running at once. A WHOIS call that hangs
+# keeps its thread, so past this cap new domains are reported as unknown
+# instead of queueing behind the stuck ones.
+WHOIS_MAX_INFLIGHT = _env_int("SCAM_WHOIS_MAX_INFLIGHT", 4 * WHOIS_MAX_CONCURRENCY)
+
+# ---- Red-flag rules ----
+DATA_DIR = os.environ.get("SCAM_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+RULES_PATH = os.environ.get("SCAM_RULES_PATH", os.path.join(DATA_DIR, "red_flag_rules.json"))
+
+# ---- Scoring ----
+# Feature weights and verdict thresholds (see verdict.py; `python verdict.py calibrate` rewrites it)
+SCORING_PATH = os.environ.get("SCAM_SCORING_PATH", os.path.join(DATA_DIR, "scoring.json"))
+
+# ---- Analysis pipeline ----
+# Threads shared by all pipeline runs in the process
+PIPELINE_WORKERS = _env_int("SCAM_PIPELINE_WORKERS", 8)
+# Per-stage timeouts in seconds; a stage that runs over is reported as degraded
+# and the rest of the pipeline carries on without it
+PIPELINE_STAGE_TIMEOUTS = {
+    name: float(os.environ.get(f"SCAM_PIPELINE_TIMEOUT_{name.upper()}", default))
+    for name, default in {
+        "rules": 5,
+        "classifier": 60,
+        "links": 20,
+        "entities": 30,
+        "mismatch": 5,
+        "grammar": 60,
+        "similarity": 30,
+    }.items()
+}
+
+# ---- Near-duplicate result cache ----
+RESULT_CACHE_ENABLED = _env_int("SCAM_RESULT_CACHE_ENABLED", 1)
+RESULT_CACHE_SIZE = _env_int("SCAM_RESULT_CACHE_SIZE", 10000)
+# Optional SQLite file so cached results survive restarts (empty = memory only)
+RESULT_CACHE_PATH = os.environ.get("SCAM_RESULT_CACHE_PATH", "")
+# Max differing SimHash bits for two messages to count as near-duplicates (at most 7)
+RESULT_CACHE_MAX_DISTANCE = min(7, _env_int("SCAM_RESULT_CACHE_MAX_DISTANCE", 6))
+# A SimHash near-duplicate is only reused when the estimated Jaccard similarity
+# of the two messages' word 3-shingles is at least this high (and both trigger
+# the same red-flag rules)
+RESULT_CACHE_MIN_RESEMBLANCE = float(os.environ.get("SCAM_RESULT_CACHE_MIN_RESEMBLANCE", "0.85"))
+
+# ---- Early-exit cascade ----
+# Run cheap stages first and skip the expensive models once the verdict can't change
+CASCADE_ENABLED = _env_int("SCAM_CASCADE_ENABLED", 1)
+# Start every tier after the first at once and stop waiting as soon as the
+# verdict is settled, so latency stays that of the slowest stage. 0 runs the
+# tiers one after another, which saves more model time (batch throughput) but
+# adds the tiers' latencies up.
+CASCADE_SPECULATIVE = _env_int("SCAM_CASCADE_SPECULATIVE", 1)
+# Fraction of early exits that still run the skipped stages to measure agreement
+CASCADE_AUDIT_RATE = float(os.environ.get("SCAM_CASCADE_AUDIT_RATE", "0"))
+
+# ---- Long-message chunking ----
+# Drop quoted replies, signatures and disclaimers before the model stages
+CHUNK_PREFILTER = _env_int("SCAM_CHUNK_PREFILTER", 1)
+# Token budget per chunk for the classifier (BART-MNLI reads at most 1024 tokens per text + hypothesis)
+CLASSIFIER_CHUNK_TOKENS = _env_int("SCAM_CLASSIFIER_CHUNK_TOKENS", 400)
+# Token budget per chunk for the embedder (0 = the model's own maximum sequence length)
+SIMILARITY_CHUNK_TOKENS = _env_int("SCAM_SIMILARITY_CHUNK_TOKENS", 0)
+# How per-chunk results are combined: "max", "mean" (token-weighted) or "attention"
+CLASSIFIER_CHUNK_AGGREGATION = os.environ.get("SCAM_CLASSIFIER_CHUNK_AGGREGATION", "max")
+SIMILARITY_CHUNK_AGGREGATION = os.environ.get("SCAM_SIMILARITY_CHUNK_AGGREGATION", "mean")
+
+# ---- Inference backend ----
+# "fp32" (reference PyTorch models), "int8" (dynamically quantized PyTorch) or
+# "onnx" (ONNX Runtime export, int8-quantized; needs optimum[onnxruntime])
+INFERENCE_BACKEND = os.environ.get("SCAM_INFERENCE_BACKEND", "fp32")
+# Intra-op / inter-op thread counts for PyTorch and ONNX Runtime (0 = library default)
+TORCH_INTRA_OP_THREADS = _env_int("SCAM_TORCH_INTRA_OP_THREADS", 0)
+TORCH_INTER_OP_THREADS = _env_int("SCAM_TORCH_INTER_OP_THREADS", 0)
+
+# ---- Metrics / tracing ----
+# Where metrics go: "" (kept in-process only), "log", or "prometheus" (text endpoint on METRICS_PORT)
+METRICS_SINK = os.environ.get("SCAM_METRICS_SINK", "")
+METRICS_PORT = _env_int("SCAM_METRICS_PORT", 9108)
+# Dump a sampled stack profile for pipeline runs slower than this many seconds (0 = off)
+PROFILE_SLOW_SECONDS = float(os.environ.get("SCAM_PROFILE_SLOW_SECONDS", "0"))
+PROFILE_INTERVAL_MS = _env_int("SCAM_PROFILE_INTERVAL_MS", 5)
+PROFILE_DIR = os.environ.get("SCAM_PROFILE_DIR", os.path.join(CACHE_DIR, "profiles"))
+
+# ---- Learned classifier head ----
+# "bart" (zero-shot BART-MNLI), "fast" (logistic head on the MiniLM message
+# embedding) or "prescreen" (head first, BART only when the head is unsure)
+CLASSIFIER_MODE = os.environ.get("SCAM_CLASSIFIER_MODE", "bart")
+FAST_CLASSIFIER_PATH = os.environ.get("SCAM_FAST_CLASSIFIER_PATH", os.path.join(CACHE_DIR, "fast_classifier.npz"))
+# In prescreen mode the head's answer is kept when its top probability reaches this
+PRESCREEN_CONFIDENCE = float(os.environ.get("SCAM_PRESCREEN_CONFIDENCE", "0.9"))
+
+# ---- Domain reputation lists ----
+# Plain-text allow/deny lists, compiled into a memory-mapped index on first use
+DOMAIN_LISTS_DIR = os.environ.get("SCAM_DOMAIN_LISTS_DIR", os.path.join(DATA_DIR, "domains"))
+DOMAIN_INDEX_PATH = os.environ.get("SCAM_DOMAIN_INDEX_PATH", os.path.join(CACHE_DIR, "domain_reputation.idx"))
+# Lists longer than this are stored as Bloom filters (small, with rare false positives)
+DOMAIN_BLOOM_THRESHOLD = _env_int("SCAM_DOMAIN_BLOOM_THRESHOLD", 1000000)
+DOMAIN_BLOOM_FP_RATE = float(os.environ.get("SCAM_DOMAIN_BLOOM_FP_RATE", "0.001"))
+
+# ---- Incremental re-analysis (UI) ----
+# Most memoized stage results (per paragraph or per whole-document input) kept in the process
+INCREMENTAL_MEMO_SIZE = _env_int("SCAM_INCREMENTAL_MEMO_SIZE", 20000)
+
+# ---- Inference server ----
+# Unix socket of inference_server.py
+INFERENCE_SOCKET = os.environ.get("SCAM_INFERENCE_SOCKET", os.path.join(CACHE_DIR, "inference.sock"))
+# Send classifier, similarity, NER and grammar calls to the server instead of loading the models in-process
+USE_INFERENCE_SERVER = _env_int("SCAM_USE_INFERENCE_SERVER", 0)
+# Pre-forked workers, and torch threads per worker (0 = CPU count / workers)
+INFERENCE_WORKERS = _env_int("SCAM_INFERENCE_WORKERS", 2)
+INFERENCE_WORKER_THREADS = _env_int("SCAM_INFERENCE_WORKER_THREADS", 0)
+# Connections allowed to wait for a free worker; beyond that clients are turned away
+INFERENCE_BACKLOG = _env_int("SCAM_INFERENCE_BACKLOG", 16)
+# Most texts in one request (the client splits bigger batches)
+INFERENCE_MAX_BATCH = _env_int("SCAM_INFERENCE_MAX_BATCH", 64)
+# Seconds a client waits to get a connection, and for the reply
+INFERENCE_CONNECT_TIMEOUT = float(os.environ.get("SCAM_INFERENCE_CONNECT_TIMEOUT", "2"))
+INFERENCE_REQUEST_TIMEOUT = float(os.environ.get("SCAM_INFERENCE_REQUEST_TIMEOUT", "120"))
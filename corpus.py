@@ -0,0 +1,99 @@
+# corpus.py
+
+# Seedable generator of synthetic job-offer messages for benchmarks. Messages
+# vary in length, number of links and entity density, and come with the
+# domain ages a fake WHOIS should report for them.
+import random
+
+COMPANIES = ["Acme Corporation", "Globex", "Initech", "Umbrella Analytics", "Stark Industries",
+             "Wayne Enterprises", "Hooli", "Vandelay Industries", "Soylent Foods", "Cyberdyne Systems"]
+PEOPLE = ["Jane Doe", "John Smith", "Maria Garcia", "Wei Chen", "Aisha Khan", "Liam O'Brien",
+          "Priya Patel", "Tom Becker", "Sara Nilsson", "Kwame Mensah"]
+ROLES = ["Data Analyst", "Software Engineer", "Customer Support Specialist", "Project Manager",
+         "Data Entry Clerk", "Marketing Coordinator", "Accountant", "QA Engineer"]
+CITIES = ["New York", "London", "Berlin", "Toronto", "Singapore", "Austin"]
+FREE_MAIL = ["gmail.com", "yahoo.com", "hotmail.com", "outlook.com"]
+SHORTENERS = ["bit.ly", "tinyurl.com"]
+
+LEGIT_SENTENCES = [
+    "Thank you for applying to {company}.",
+    "We are pleased to invite you to interview for the {role} position.",
+    "This is a full-time role based in our {city} office.",
+    "The salary range for this position is ${low},000 - ${high},000 per year.",
+    "Please let us know a suitable time for a video interview next week.",
+    "You can find more information about the team at {link}.",
+    "{person} from our HR team will coordinate the next steps.",
+    "The interview will take about 45 minutes and includes a short technical discussion.",
+    "Benefits include health insurance, a pension plan and 25 days of paid leave.",
+    "Please review the attached job description before the call.",
+]
+SCAM_SENTENCES = [
+    "Congratulations! You have been selected for a remote {role} position with {company}.",
+    "We need your response within 24 hours or the offer will expire.",
+    "As a welcome gesture we offer an upfront payment of ${amount} which you will receive immediately.",
+    "Please send your bank account details and a copy of your ID card for verification.",
+    "To secure your spot, purchase a gift card for the training materials and send us the code.",
+    "No experience is required and you can earn ${amount} per week from home.",
+    "Click {link} to complete your onboarding form now.",
+    "Our manager {person} will contact you on Telegram to finalize everything.",
+    "This is a limited time opportunity, act immediately.",
+    "Payment will be made in bitcoin or through Western Union.",
+]
+
+
+def _domain_for(company):
+    return company.lower().replace(" ", "") + ".com"
+
+
+def generate_message(rng, scam, min_sentences=4, max_sentences=40, max_links=4):
+    company = rng.choice(COMPANIES)
+    person = rng.choice(PEOPLE)
+    company_domain = _domain_for(company)
+    ages = {}
+    links = []
+    for _ in range(rng.randint(0, max_links)):
+        if scam and rng.random() < 0.5:
+            domain = rng.choice(SHORTENERS)
+        elif scam:
+            domain = f"{company_domain[:-4]}-careers{rng.randint(1, 999)}.com"
+            ages[domain] = rng.choice([0, 1])
+        else:
+            domain = company_domain
+        ages.setdefault(domain, rng.randint(3, 25))
+        links.append(f"https://{domain}/jobs/{rng.randint(1000, 9999)}")
+
+    pool = SCAM_SENTENCES if scam else LEGIT_SENTENCES
+    sentences = []
+    for i in range(rng.randint(min_sentences, max_sentences)):
+        template = rng.choice(pool)
+        if "{link}" in template and not links:
+            continue
+        sentences.append(template.format(
+            company=rng.choice(COMPANIES) if rng.random() < 0.2 else company,
+            role=rng.choice(ROLES),
+            city=rng.choice(CITIES),
+            person=rng.choice(PEOPLE) if rng.random() < 0.3 else person,
+            link=links[i % len(links)] if links else "",
+            low=rng.randint(40, 90),
+            high=rng.randint(91, 150),
+            amount=rng.choice([250, 500, 750, 1500]),
+        ))
+
+    sender_domain = rng.choice(FREE_MAIL) if scam and rng.random() < 0.7 else company_domain
+    ages.setdefault(sender_domain, rng.randint(5, 25))
+    sender = person.lower().replace(" ", ".").replace("'", "") + "@" + sender_domain
+    text = "Dear Candidate,\n\n" + " ".join(sentences) + f"\n\nBest regards,\n{person}\n{company}\n{sender}"
+    return text, ages
+
+
+def generate_corpus(n, seed=0, scam_ratio=0.5, min_sentences=4, max_sentences=40, max_links=4):
+    # Returns (messages, domain_ages); each message is {"id", "label", "text"}
+    rng = random.Random(seed)
+    messages = []
+    domain_ages = {}
+    for i in range(n):
+        scam = rng.random() < scam_ratio
+        text, ages = generate_message(rng, scam, min_sentences, max_sentences, max_links)
+        domain_ages.update(ages)
+        messages.append({"id": i, "label": "scam" if scam else "legit", "text": text})
+    return messages, domain_ages
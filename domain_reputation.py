@@ -0,0 +1,245 @@
+# domain_reputation.py
+
+# One domain reputation index shared by verification.py, link_analysis.py and
+# the red-flag rules. Plain-text lists (see data/domains/) are compiled into a
+# single binary file of open-addressing hash tables of 64-bit domain hashes,
+# which is memory-mapped on load, so start-up is fast and each lookup is O(1)
+# per label of the domain (a host also matches entries for its parent domains).
+# Very large lists can be stored as Bloom filters instead.
+#
+#   python domain_reputation.py compile     # rebuild the index after editing the lists
+#   python domain_reputation.py lookup mail.example.com
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+import config
+
+# Category -> list file in DOMAIN_LISTS_DIR
+LIST_FILES = {
+    "free_mail": "free_mail.txt",
+    "shortener": "url_shorteners.txt",
+    "disposable": "disposable.txt",
+    "scam": "scam_domains.txt",
+    "allow": "allow.txt",
+}
+
+_MAGIC = b"DOMREP01"
+_EMPTY = 0
+
+
+def _hash64(domain):
+    value = int.from_bytes(hashlib.blake2b(domain.encode("utf-8"), digest_size=8).digest(), "little")
+    return value or 1  # 0 marks an empty slot
+
+
+def _bloom_positions(domain, bits, k):
+    digest = hashlib.blake2b(domain.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(k)]
+
+
+def normalize_domain(domain):
+    domain = domain.strip().lower().rstrip(".")
+    if "@" in domain:
+        domain = domain.rsplit("@", 1)[1]
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+
+def read_list(path):
+    domains = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                domains.add(normalize_domain(line))
+    return domains
+
+
+def _sources_signature(lists_dir):
+    h = hashlib.sha1()
+    h.update(f"{config.DOMAIN_BLOOM_THRESHOLD}|{config.DOMAIN_BLOOM_FP_RATE}".encode())
+    for category, name in sorted(LIST_FILES.items()):
+        path = os.path.join(lists_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{category}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+# ---- Compile ----
+
+def _build_table(domains):
+    slots = 1 << max(3, math.ceil(math.log2(max(1, len(domains)) * 2)))
+    table = [_EMPTY] * slots
+    mask = slots - 1
+    for domain in domains:
+        h = _hash64(domain)
+        i = h & mask
+        while table[i] not in (_EMPTY, h):
+            i = (i + 1) & mask
+        table[i] = h
+    return table, {"kind": "table", "slots": slots}
+
+
+def _build_bloom(domains, fp_rate):
+    n = max(1, len(domains))
+    bits = max(64, int(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+    bits = (bits + 63) // 64 * 64
+    k = max(1, round(bits / n * math.log(2)))
+    words = [0] * (bits // 64)
+    for domain in domains:
+        for pos in _bloom_positions(domain, bits, k):
+            words[pos >> 6] |= 1 << (pos & 63)
+    return words, {"kind": "bloom", "bits": bits, "k": k}
+
+
+def compile_index(lists_dir=None, out_path=None):
+    lists_dir = lists_dir or config.DOMAIN_LISTS_DIR
+    out_path = out_path or config.DOMAIN_INDEX_PATH
+    header = {"signature": _sources_signature(lists_dir), "categories": {}}
+    blobs = []
+    offset = 0
+    for category, name in sorted(LIST_FILES.items()):
+        path = os.path.join(lists_dir, name)
+        domains = read_list(path) if os.path.exists(path) else set()
+        if len(domains) > config.DOMAIN_BLOOM_THRESHOLD:
+            words, meta = _build_bloom(domains, config.DOMAIN_BLOOM_FP_RATE)
+        else:
+            words, meta = _build_table(domains)
+        meta.update({"count": len(domains), "offset": offset, "words": len(words)})
+        header["categories"][category] = meta
+        blobs.append(struct.pack(f"<{len(words)}Q", *words))
+        offset += len(words) * 8
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    # Pad the header so the uint64 arrays start 8-byte aligned
+    header_bytes += b" " * (-(len(_MAGIC) + 8 + len(header_bytes)) % 8)
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    # Unique temp file so processes compiling at the same time don't write over each other
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=".domain_reputation-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return header
+
+
+# ---- Lookup ----
+
+class DomainReputationIndex:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a domain reputation index")
+        header_len = struct.unpack_from("<Q", self._mmap, len(_MAGIC))[0]
+        start = len(_MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_len])
+        data_start = start + header_len
+        self._words = {}
+        for category, meta in self.header["categories"].items():
+            begin = data_start + meta["offset"]
+            self._words[category] = memoryview(self._mmap)[begin:begin + meta["words"] * 8].cast("Q")
+
+    def _contains(self, category, domain):
+        meta = self.header["categories"].get(category)
+        if meta is None or not meta["count"]:
+            return False
+        words = self._words[category]
+        if meta["kind"] == "bloom":
+            return all(words[pos >> 6] >> (pos & 63) & 1 for pos in _bloom_positions(domain, meta["bits"], meta["k"]))
+        h = _hash64(domain)
+        mask = meta["slots"] - 1
+        i = h & mask
+        while True:
+            slot = words[i]
+            if slot == h:
+                return True
+            if slot == _EMPTY:
+                return False
+            i = (i + 1) & mask
+
+    def match(self, domain, category):
+        # Returns the listed domain that `domain` (or one of its parent domains) matches, or None
+        domain = normalize_domain(domain)
+        labels = domain.split(".")
+        for i in range(len(labels) - 1):
+            candidate = ".".join(labels[i:])
+            if self._contains(category, candidate):
+                return candidate
+        return None
+
+    def categories(self, domain):
+        return {category for category in self.header["categories"] if self.match(domain, category)}
+
+    def is_free_mail(self, domain):
+        return self.match(domain, "free_mail") is not None
+
+    def is_disposable(self, domain):
+        return self.match(domain, "disposable") is not None
+
+    def is_shortener(self, domain):
+        return self.match(domain, "shortener") is not None
+
+    def is_scam(self, domain):
+        return self.match(domain, "scam") is not None
+
+    def is_allowed(self, domain):
+        return self.match(domain, "allow") is not None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    # Loads the compiled index, recompiling it first if the lists changed
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = config.DOMAIN_INDEX_PATH
+            signature = _sources_signature(config.DOMAIN_LISTS_DIR)
+            index = DomainReputationIndex(path) if os.path.exists(path) else None
+            if index is None or index.header.get("signature") != signature:
+                compile_index()
+                index = DomainReputationIndex(path)
+            _index = index
+        return _index
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compile"]:
+        header = compile_index()
+        for category, meta in header["categories"].items():
+            print(f"{category:<12} {meta['count']:>9} domains ({meta['kind']})")
+    elif argv[:1] == ["lookup"] and len(argv) > 1:
+        index = get_index()
+        for domain in argv[1:]:
+            print(domain, sorted(index.categories(domain)) or "-")
+    else:
+        print("usage: python domain_reputation.py compile | lookup DOMAIN...", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
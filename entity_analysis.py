@@ -1,9 +1,9 @@
-import spacy
+from extraction import email_spans
+from spacy_pipeline import parse
 
-nlp = spacy.load("en_core_web_sm")
-
-def extract_entities(text):
-    doc = nlp(text)
+def extract_entities(text, doc=None):
+    if doc is None:
+        doc = parse(text)
     orgs = set()
     persons = set()
     titles = set()
@@ -22,17 +22,17 @@ def extract_entities(text):
         "titles": list(titles)
     }
 
-def analyze_entities(text, extracted_emails):
+def analyze_entities(text, extracted_emails, doc=None):
     report = []
-    entities = extract_entities(text)
+    entities = extract_entities(text, doc=doc)
     orgs = entities["organizations"]
-    emails = extracted_emails or []
+    emails = set(extracted_emails or [])
+    domains = [span["host"] for span in email_spans(text) if span["text"] in emails]
     seen_pairs = set()
 
     if orgs:
         for org in orgs:
-            for email in emails:
-                domain = email.split("@")[1]
+            for domain in domains:
                 pair = (org.lower().strip(), domain.lower().strip())
                 if pair in seen_pairs:
                     continue
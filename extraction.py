@@ -0,0 +1,95 @@
+# extraction.py
+
+# One pass over a message for the email addresses and URLs in it. Every stage
+# (link checks, NER, the org/domain mismatch check, legacy link analysis) reads
+# the same span list, so they agree on what counts as an email and the regex
+# and public-suffix work is only done once per message.
+import re
+import threading
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# URLs are tried first so an address inside a link (?ref=a@b.com) stays part of the link
+_SPAN_PATTERN = re.compile(
+    r"(?P<url>https?://[^\s<>\"'`]+)"
+    r"|(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)",
+    re.IGNORECASE,
+)
+# Sentence punctuation that sticks to the end of a URL in running text
+_URL_TRAILING = ".,;:!?)]}'\""
+
+_tld_lock = threading.Lock()
+_tld_extract = None
+
+
+def _get_tld_extract():
+    # Offline: the public suffix list bundled with tldextract, no HTTP fetch
+    # and no on-disk cache
+    global _tld_extract
+    with _tld_lock:
+        if _tld_extract is None:
+            import tldextract
+
+            _tld_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+        return _tld_extract
+
+
+@lru_cache(maxsize=65536)
+def registered_domain(host):
+    # "mail.careers.acme.co.uk" -> "acme.co.uk"; "" for IPs and bare suffixes
+    parts = _get_tld_extract()(host)
+    if parts.domain and parts.suffix:
+        return f"{parts.domain}.{parts.suffix}"
+    return ""
+
+
+def _host_of_url(url):
+    try:
+        return (urlsplit(url).hostname or "").rstrip(".")
+    except ValueError:
+        return ""
+
+
+@lru_cache(maxsize=256)
+def extract(text):
+    # Typed spans in text order:
+    #   {"kind": "email"|"url", "text", "start", "end", "host", "domain"}
+    # "host" is the email domain / URL hostname (lowercased) and "domain" its
+    # registered domain. The result is cached per text and shared, so treat it
+    # as read-only.
+    spans = []
+    for m in _SPAN_PATTERN.finditer(text):
+        value = m.group()
+        end = m.end()
+        if m.lastgroup == "url":
+            stripped = value.rstrip(_URL_TRAILING)
+            end -= len(value) - len(stripped)
+            value = stripped
+            host = _host_of_url(value).lower()
+        else:
+            host = value.rsplit("@", 1)[1].lower()
+        spans.append({
+            "kind": m.lastgroup,
+            "text": value,
+            "start": m.start(),
+            "end": end,
+            "host": host,
+            "domain": registered_domain(host) if host else "",
+        })
+    return tuple(spans)
+
+
+def email_spans(text):
+    return [span for span in extract(text) if span["kind"] == "email"]
+
+
+def url_spans(text):
+    return [span for span in extract(text) if span["kind"] == "url"]
+
+
+def extract_emails(text):
+    return [span["text"] for span in email_spans(text)]
+
+
+def extract_urls(text):
+    return [span["text"] for span in url_spans(text)]
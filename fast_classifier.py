@@ -0,0 +1,186 @@
+# fast_classifier.py
+
+# A small learned head on top of the MiniLM message embedding that
+# similarity.py already computes. It is trained offline with scikit-learn and
+# saved as plain NumPy arrays plus metadata, so serving it needs neither
+# sklearn nor a second transformer and loads in milliseconds.
+#
+#   python fast_classifier.py features --data labelled.jsonl --out features.npz
+#   python fast_classifier.py train --data labelled.jsonl --out fast_classifier.npz
+#   python fast_classifier.py train --features features.npz --out fast_classifier.npz
+#
+# Labelled JSONL lines look like {"text": "...", "label": "scam"}; labels may be
+# the classifier's own label names or the short forms below.
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import config
+import model_registry
+from ai_model import CANDIDATE_LABELS
+
+ARTIFACT_VERSION = 1
+
+LABEL_ALIASES = {
+    "legit": "Legitimate Job Offer",
+    "legitimate": "Legitimate Job Offer",
+    "scam": "Phishing/Scam Email",
+    "phishing": "Phishing/Scam Email",
+    "spam": "Spam/Promotional Content",
+}
+
+
+def _feature_signature():
+    # The head only makes sense on embeddings from the same model and backend
+    return f"{config.SIMILARITY_MODEL}|{config.INFERENCE_BACKEND}"
+
+
+def _normalize_label(label):
+    label = LABEL_ALIASES.get(str(label).lower(), label)
+    if label not in CANDIDATE_LABELS:
+        raise ValueError(f"Unknown label {label!r}")
+    return label
+
+
+def load_labelled(path):
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record["text"])
+                labels.append(_normalize_label(record["label"]))
+    return texts, labels
+
+
+def export_features(texts, labels, out_path):
+    from similarity import embed_messages
+
+    features = embed_messages(texts)
+    np.savez(out_path, features=features, labels=np.array(labels), signature=np.array(_feature_signature()))
+    return features
+
+
+def load_features(path):
+    data = np.load(path)
+    if str(data["signature"]) != _feature_signature():
+        raise ValueError(f"{path} was built with {data['signature']}, not {_feature_signature()}")
+    return data["features"], [str(label) for label in data["labels"]]
+
+
+def train(features, labels, out_path, test_size=0.2, seed=0):
+    from sklearn import __version__ as sklearn_version
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+
+    present = [label for label in CANDIDATE_LABELS if label in set(labels)]
+    y = np.array([present.index(label) for label in labels])
+    metrics = {}
+    if test_size and len(labels) >= 10:
+        x_train, x_test, y_train, y_test = train_test_split(
+            features, y, test_size=test_size, random_state=seed, stratify=y
+        )
+        held_out = LogisticRegression(max_iter=1000, class_weight="balanced").fit(x_train, y_train)
+        metrics["heldout_accuracy"] = float(held_out.score(x_test, y_test))
+        metrics["heldout_size"] = int(len(y_test))
+
+    head = LogisticRegression(max_iter=1000, class_weight="balanced").fit(features, y)
+    coef, intercept = head.coef_, head.intercept_
+    if len(present) == 2:
+        # Binary sklearn models keep one row; expand to one row per class
+        coef = np.vstack([-coef[0] / 2, coef[0] / 2])
+        intercept = np.array([-intercept[0] / 2, intercept[0] / 2])
+
+    meta = {
+        "version": ARTIFACT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "signature": _feature_signature(),
+        "labels": present,
+        "dim": int(features.shape[1]),
+        "trained_on": int(len(labels)),
+        "sklearn_version": sklearn_version,
+        "metrics": metrics,
+    }
+    np.savez(out_path, coef=coef.astype(np.float32), intercept=intercept.astype(np.float32),
+             meta=np.array(json.dumps(meta)))
+    return meta
+
+
+class FastHead:
+    def __init__(self, path):
+        data = np.load(path)
+        self.meta = json.loads(str(data["meta"]))
+        if self.meta["version"] != ARTIFACT_VERSION:
+            raise ValueError(f"{path}: unsupported artifact version {self.meta['version']}")
+        if self.meta["signature"] != _feature_signature():
+            raise ValueError(f"{path} was trained on {self.meta['signature']}, not {_feature_signature()}")
+        self.coef = data["coef"]
+        self.intercept = data["intercept"]
+        self.labels = self.meta["labels"]
+
+    def predict(self, vectors):
+        # vectors: (n, dim) -> (n, labels) probabilities
+        logits = np.asarray(vectors, dtype=np.float32) @ self.coef.T + self.intercept
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+
+model_registry.register("fast_head", lambda: FastHead(config.FAST_CLASSIFIER_PATH))
+
+
+def classify_embedding(vector):
+    # Same output shape as ai_model.classify_text
+    head = model_registry.get("fast_head")
+    probs = head.predict(np.asarray(vector).reshape(1, -1))[0]
+    label_scores = {label: 0.0 for label in CANDIDATE_LABELS}
+    label_scores.update({label: float(p) for label, p in zip(head.labels, probs)})
+    ranked = sorted(label_scores.items(), key=lambda kv: kv[1], reverse=True)
+    return {
+        "label": ranked[0][0],
+        "score": ranked[0][1],
+        "scores": dict(ranked),
+        "source": "head",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and export the fast embedding classifier head.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    feat = sub.add_parser("features", help="embed a labelled JSONL file and save the features")
+    feat.add_argument("--data", required=True)
+    feat.add_argument("--out", required=True)
+
+    tr = sub.add_parser("train", help="fit the head and save the versioned artifact")
+    source = tr.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data", help="labelled JSONL file")
+    source.add_argument("--features", help="features file from the 'features' command")
+    tr.add_argument("--out", default=config.FAST_CLASSIFIER_PATH)
+    tr.add_argument("--test-size", type=float, default=0.2)
+    tr.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "features":
+        texts, labels = load_labelled(args.data)
+        features = export_features(texts, labels, args.out)
+        print(f"Saved {features.shape[0]} x {features.shape[1]} features to {args.out}", file=sys.stderr)
+        return
+
+    if args.features:
+        features, labels = load_features(args.features)
+    else:
+        from similarity import embed_messages
+
+        texts, labels = load_labelled(args.data)
+        features = embed_messages(texts)
+    meta = train(features, labels, args.out, test_size=args.test_size, seed=args.seed)
+    json.dump(meta, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,216 @@
-import language_tool_python
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-def grammar_check(text):
-    tool = language_tool_python.LanguageTool('en-US')
-    matches = tool.check(text)
-    error_count = len(matches)
-    words = len(text.split())
+import config
+import metrics
+import model_registry
+
+
+class LanguageToolPool:
+    # Keeps a fixed number of LanguageTool servers alive so we only pay the
+    # Java startup once per instance instead of once per message.
+    def __init__(self, size=None, language=None, disabled_categories=None):
+        self.size = max(1, size or config.GRAMMAR_POOL_SIZE)
+        self.language = language or config.GRAMMAR_LANGUAGE
+        if disabled_categories is None:
+            disabled_categories = config.GRAMMAR_DISABLED_CATEGORIES
+        self.disabled_categories = set(disabled_categories)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _new_tool(self):
+        import language_tool_python
+
+        tool = language_tool_python.LanguageTool(self.language)
+        if self.disabled_categories:
+            tool.disabled_categories = set(self.disabled_categories)
+        return tool
+
+    def _acquire(self, timeout):
+        try:
+            return self._checkout(*self._idle.get_nowait())
+        except queue.Empty:
+            pass
+        # Grow lazily up to the configured size
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("LanguageTool pool is closed")
+            grow = self._created < self.size
+            if grow:
+                self._created += 1
+        if grow:
+            try:
+                return self._new_tool()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._checkout(*self._idle.get(timeout=timeout))
+        except queue.Empty:
+            metrics.incr("grammar_acquire_timeouts_total")
+            raise RuntimeError(
+                f"No LanguageTool instance became free within {timeout}s "
+                f"(pool size {self.size}); raise SCAM_GRAMMAR_POOL_SIZE or "
+                f"SCAM_GRAMMAR_ACQUIRE_TIMEOUT"
+            ) from None
+
+    def _checkout(self, tool, released_at):
+        # An instance that sat idle for a while may have lost its Java server;
+        # ping it before handing it out
+        if time.monotonic() - released_at < config.GRAMMAR_HEALTH_INTERVAL:
+            return tool
+        try:
+            tool.check("ping")
+            return tool
+        except Exception:
+            metrics.incr("grammar_restarts_total")
+        try:
+            return self._restart(tool)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, tool):
+        if self._closed:
+            _close_quietly(tool)
+        else:
+            self._idle.put((tool, time.monotonic()))
+
+    def _restart(self, tool):
+        _close_quietly(tool)
+        return self._new_tool()
+
+    @contextmanager
+    def tool(self, timeout=None):
+        tool = self._acquire(timeout or config.GRAMMAR_ACQUIRE_TIMEOUT)
+        try:
+            yield tool
+        finally:
+            self._release(tool)
+
+    def check(self, text):
+        tool = self._acquire(config.GRAMMAR_ACQUIRE_TIMEOUT)
+        try:
+            try:
+                with metrics.span("model", model="grammar"):
+                    return tool.check(text)
+            except Exception:
+                # The Java server most likely died; restart it and retry once
+                metrics.incr("grammar_restarts_total")
+                tool = self._restart(tool)
+                with metrics.span("model", model="grammar"):
+                    return tool.check(text)
+        except Exception:
+            # Don't lose a pool slot because of a broken instance
+            with self._lock:
+                self._created -= 1
+            _close_quietly(tool)
+            tool = None
+            raise
+        finally:
+            if tool is not None:
+                self._release(tool)
+
+    def health_check(self):
+        # Ping every idle instance and restart the ones that don't answer.
+        # Returns the number of instances that had to be restarted.
+        restarted = 0
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait()[0])
+            except queue.Empty:
+                break
+        for tool in idle:
+            try:
+                tool.check("ping")
+            except Exception:
+                restarted += 1
+                metrics.incr("grammar_restarts_total")
+                try:
+                    tool = self._restart(tool)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    continue
+            self._release(tool)
+        return restarted
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._created = 0
+        while True:
+            try:
+                _close_quietly(self._idle.get_nowait()[0])
+            except queue.Empty:
+                break
+
+
+def _close_quietly(tool):
+    try:
+        tool.close()
+    except Exception:
+        pass
+
+
+def _load_pool():
+    pool = LanguageToolPool()
+    atexit.register(pool.close)
+    return pool
+
+
+# Warming up boots the first LanguageTool server
+model_registry.register("grammar", _load_pool, warmup=lambda pool: pool.check("Warmup message."))
+
+
+def get_pool():
+    # Process-wide pool, created on first use
+    return model_registry.get("grammar")
+
+
+def close_pool():
+    # Stop this process's LanguageTool servers, if it started any. Forked and
+    # pool workers leave through os._exit, which skips the atexit hook, so
+    # they call this themselves or the Java servers outlive them.
+    if model_registry.is_loaded("grammar"):
+        get_pool().close()
+
+
+def grammar_score(error_count, words):
     # Compute a "grammar score" (fewer errors = higher score)
+    if words == 0:
+        return 100
+    return round(max(0, 100 - (error_count / max(words, 1) * 100)), 2)
+
+
+def _score_matches(text, matches):
+    words = len(text.split())
     if words == 0:
         return 100, []
-    score = max(0, 100 - (error_count / max(words, 1) * 100))
     errors = [match.ruleIssueType + ": " + match.message for match in matches]
-    return round(score, 2), errors
+    return grammar_score(len(matches), words), errors
+
+
+def grammar_check(text):
+    if not text.split():
+        return 100, []
+    matches = get_pool().check(text)
+    return _score_matches(text, matches)
+
+
+def grammar_check_batch(texts, max_workers=None):
+    # Check many texts concurrently against the shared pool.
+    # Results come back in the same order as the input.
+    pool = get_pool()
+    workers = max_workers or pool.size
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(grammar_check, texts))
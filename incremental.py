@@ -0,0 +1,250 @@
+# incremental.py
+
+# Re-analysis of an edited message without redoing the work for the parts
+# that didn't change. Rule scanning, NER and grammar run per paragraph and are
+# memoized on each paragraph's content hash, so an edit only re-runs them on
+# the paragraphs that changed. The whole-document stages are memoized on a
+# hash of their actual input (the prefiltered text for the models, the
+# extracted emails/URLs for the link checks, ...) and reused while it is
+# unchanged. Everything else is run_pipeline as usual.
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import config
+import metrics
+from pipeline import STAGES, Stage, run_pipeline
+
+_PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+_MISSING = object()
+
+
+def content_key(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(b"\0")
+        h.update((part if isinstance(part, str) else repr(part)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def split_paragraphs(text):
+    # [(offset, paragraph)] for the non-blank paragraphs, in order
+    paragraphs = []
+    start = 0
+    for m in _PARAGRAPH_BREAK_RE.finditer(text):
+        if text[start:m.start()].strip():
+            paragraphs.append((start, text[start:m.start()]))
+        start = m.end()
+    if text[start:].strip():
+        paragraphs.append((start, text[start:]))
+    return paragraphs
+
+
+class StageMemo:
+    # Bounded LRU of stage outputs keyed on (stage, content hash). Shared by
+    # every session, so it only ever holds results that depend on content alone.
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or config.INCREMENTAL_MEMO_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage, key):
+        with self._lock:
+            value = self._entries.get((stage, key), _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self._entries.move_to_end((stage, key))
+                self.hits += 1
+        metrics.incr("incremental_memo_total", stage=stage, result="miss" if value is _MISSING else "hit")
+        return value
+
+    def put(self, stage, key, value):
+        with self._lock:
+            self._entries[(stage, key)] = value
+            self._entries.move_to_end((stage, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _per_paragraph(memo, name, paragraphs, compute, reuse):
+    # Memoized per-paragraph outputs; compute([(offset, paragraph)]) runs on the misses only
+    keys = [content_key(paragraph) for _, paragraph in paragraphs]
+    results = [memo.get(name, key) for key in keys]
+    todo = [i for i, value in enumerate(results) if value is _MISSING]
+    if todo:
+        for i, value in zip(todo, compute([paragraphs[i] for i in todo])):
+            memo.put(name, keys[i], value)
+            results[i] = value
+    reuse[name] = (len(paragraphs) - len(todo), len(paragraphs))
+    return results
+
+
+def _model_input(text):
+    # The models only see the prefiltered text, so signature or quoted-reply
+    # edits don't invalidate them
+    if config.CHUNK_PREFILTER:
+        from chunking import prefilter
+
+        return prefilter(text)
+    return text
+
+
+# Whole-document stages: name -> key(text, outputs) of the input the stage really depends on
+_WHOLE_DOCUMENT_KEYS = {
+    "embedding": lambda text, outputs: _model_input(text),
+    "classifier": lambda text, outputs: (config.CLASSIFIER_MODE, _model_input(text)),
+    "similarity": lambda text, outputs: _model_input(text),
+    "links": lambda text, outputs: tuple(span["text"] for span in outputs["extraction"]),
+    "mismatch": lambda text, outputs: (
+        tuple(outputs["entities"].get("ORG", [])),
+        tuple(span["host"] for span in outputs["extraction"] if span["kind"] == "email"),
+    ),
+}
+
+
+def incremental_stages(memo, reuse):
+    # STAGES with memoized implementations; `reuse` is filled with
+    # stage -> (results reused, results needed) as the stages run
+
+    def run_rules(text, outputs):
+        from rules import highlight_text, scan_text, triggered_rules
+
+        paragraphs = split_paragraphs(text)
+        spans = outputs["extraction"]
+
+        def compute(items):
+            # Each paragraph's spans, shifted to paragraph offsets (spans never cross a blank line)
+            return [
+                scan_text(p, spans=[dict(s, start=s["start"] - offset, end=s["end"] - offset)
+                                    for s in spans if offset <= s["start"] < offset + len(p)])
+                for offset, p in items
+            ]
+
+        per_paragraph = _per_paragraph(memo, "rules", paragraphs, compute, reuse)
+        matches = [
+            dict(match, start=match["start"] + offset, end=match["end"] + offset)
+            for (offset, _), found in zip(paragraphs, per_paragraph)
+            for match in found
+        ]
+        return {
+            "flags": [rule["name"] for rule in triggered_rules(matches)],
+            "matches": matches,
+            "highlighted": highlight_text(text, matches),
+        }
+
+    def run_entities(text, outputs):
+        spans = outputs["extraction"]
+
+        def compute(items):
+            if config.USE_INFERENCE_SERVER:
+                from inference_server import get_client
+
+                return get_client().get_entities_batch([p for _, p in items])
+            from ner import get_entities
+            from spacy_pipeline import parse_many
+
+            docs = parse_many([p for _, p in items])
+            return [
+                get_entities(p, doc=doc, spans=[s for s in spans if offset <= s["start"] < offset + len(p)])
+                for (offset, p), doc in zip(items, docs)
+            ]
+
+        entities = {}
+        for found in _per_paragraph(memo, "entities", split_paragraphs(text), compute, reuse):
+            for label, values in found.items():
+                entities.setdefault(label, []).extend(values)
+        return entities
+
+    def run_grammar(text, outputs):
+        from grammar import grammar_score
+
+        def compute(items):
+            if config.USE_INFERENCE_SERVER:
+                from inference_server import get_client
+
+                results = get_client().grammar_check_batch([p for _, p in items])
+            else:
+                from grammar import grammar_check_batch
+
+                results = grammar_check_batch([p for _, p in items])
+            return [{"words": len(p.split()), "issues": issues} for (_, p), (_, issues) in zip(items, results)]
+
+        per_paragraph = _per_paragraph(memo, "grammar", split_paragraphs(text), compute, reuse)
+        issues = [issue for part in per_paragraph for issue in part["issues"]]
+        words = sum(part["words"] for part in per_paragraph)
+        return {"score": grammar_score(len(issues), words), "issues": issues}
+
+    def memoized(stage, key_func):
+        def func(text, outputs):
+            key = content_key(key_func(text, outputs))
+            value = memo.get(stage.name, key)
+            if value is _MISSING:
+                value = stage.func(text, outputs)
+                memo.put(stage.name, key, value)
+                reuse[stage.name] = (0, 1)
+            else:
+                reuse[stage.name] = (1, 1)
+            return value
+        return func
+
+    per_paragraph_funcs = {"rules": run_rules, "entities": run_entities, "grammar": run_grammar}
+    stages = []
+    for stage in STAGES:
+        func = per_paragraph_funcs.get(stage.name)
+        if func is None and stage.name in _WHOLE_DOCUMENT_KEYS:
+            func = memoized(stage, _WHOLE_DOCUMENT_KEYS[stage.name])
+        stages.append(Stage(stage.name, func or stage.func, stage.deps, stage.default, stage.feature))
+    return stages
+
+
+def reuse_status(counts, status):
+    # "cached" when every result was reused, "partial" when only some were
+    if status != "ok" or not counts or not counts[0]:
+        return status
+    return "cached" if counts[0] == counts[1] else "partial"
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def get_memo():
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = StageMemo()
+        return _memo
+
+
+def run_incremental(text, memo=None, on_stage=None, cascade=None):
+    # run_pipeline with memoized stages. Stage statuses are "cached" /
+    # "partial" where results were reused and result["reuse"] has the
+    # per-stage (reused, needed) counts. The near-duplicate result cache is
+    # bypassed: an analyst editing a message wants the edit reflected exactly.
+    memo = memo or get_memo()
+    reuse = {}
+
+    def report(name, value, status, seconds):
+        if on_stage is not None:
+            on_stage(name, value, reuse_status(reuse.get(name), status), seconds)
+
+    result = run_pipeline(text, on_stage=report, cache=False, cascade=cascade,
+                          stages=incremental_stages(memo, reuse))
+    for name, counts in reuse.items():
+        result["status"][name] = reuse_status(counts, result["status"].get(name))
+    result["reuse"] = dict(reuse)
+    return result
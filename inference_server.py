@@ -0,0 +1,432 @@
+# inference_server.py
+
+# Local multi-worker inference server. The parent process loads the models
+# once, freezes its heap and only then forks the workers, so the weights are
+# shared copy-on-write between them instead of being loaded once per worker.
+# Workers take turns accepting connections on one Unix socket; a request is a
+# batch of texts for one operation. The listen backlog is bounded: when every
+# worker is busy and the backlog is full, clients are turned away (ServerBusy)
+# instead of queueing without limit.
+#
+#   python inference_server.py serve --workers 4
+#   python inference_server.py memory      # per-process RSS / PSS
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+
+import config
+import metrics
+
+_HEADER = struct.Struct("!I")
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+# Loaded in the parent before forking. LanguageTool runs in its own Java
+# process, so each worker starts its grammar pool lazily after the fork.
+SHARED_MODELS = ["classifier", "embedder", "spacy"]
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class InferenceError(Exception):
+    pass
+
+
+# ---- Wire format: 4-byte length + JSON ----
+
+def _json_default(value):
+    # numpy scalars/arrays in model outputs
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def send_message(sock, obj):
+    data = json.dumps(obj, default=_json_default).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"message too large ({size} bytes)")
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+# ---- Operations (run in the workers) ----
+
+def _classify(texts):
+    from ai_model import classify_texts
+
+    return classify_texts(texts)
+
+
+def _similarity(texts):
+    from similarity import compute_similarity
+
+    return [list(compute_similarity(text)) for text in texts]
+
+
+def _entities(texts):
+    from ner import get_entities_batch
+
+    return get_entities_batch(texts)
+
+
+def _grammar(texts):
+    from grammar import grammar_check_batch
+
+    return [list(result) for result in grammar_check_batch(texts)]
+
+
+OPERATIONS = {
+    "classify": _classify,
+    "similarity": _similarity,
+    "entities": _entities,
+    "grammar": _grammar,
+}
+
+
+def handle_request(request):
+    op = request.get("op")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid(), "memory": process_memory(os.getpid())}
+    func = OPERATIONS.get(op)
+    if func is None:
+        return {"ok": False, "error": f"unknown operation: {op!r}"}
+    texts = request.get("texts")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return {"ok": False, "error": "texts must be a list of strings"}
+    if len(texts) > config.INFERENCE_MAX_BATCH:
+        return {"ok": False, "error": f"batch of {len(texts)} exceeds the limit of {config.INFERENCE_MAX_BATCH}"}
+    with metrics.span("inference_request", op=op):
+        results = func(texts) if texts else []
+    metrics.observe("inference_batch_texts", len(texts), op=op)
+    return {"ok": True, "results": results}
+
+
+# ---- Memory reporting ----
+
+def process_memory(pid):
+    # RSS, PSS and the shared/private split in MB (Linux /proc). PSS divides
+    # shared pages between the processes mapping them, so the PSS sum over
+    # the parent and workers is what the server really costs.
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {}
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "rss_mb": mb(fields.get("Rss", 0)),
+        "pss_mb": mb(fields.get("Pss", 0)),
+        "shared_mb": mb(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)),
+        "private_mb": mb(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)),
+    }
+
+
+def memory_report(status_path=None):
+    status_path = status_path or config.INFERENCE_SOCKET + ".json"
+    with open(status_path, encoding="utf-8") as f:
+        status = json.load(f)
+    processes = {"parent": status["parent"]}
+    for pid, index in status["workers"].items():
+        processes[f"worker-{index}"] = int(pid)
+    rows = {name: dict(process_memory(pid), pid=pid) for name, pid in processes.items()}
+    totals = {
+        "rss_sum_mb": round(sum(row.get("rss_mb", 0) for row in rows.values()), 1),
+        "pss_sum_mb": round(sum(row.get("pss_mb", 0) for row in rows.values()), 1),
+    }
+    return {"processes": rows, "totals": totals}
+
+
+# ---- Server ----
+
+def _stop_worker(signum, frame):
+    from grammar import close_pool
+
+    close_pool()
+    os._exit(0)
+
+
+class InferenceServer:
+    def __init__(self, path=None, workers=None, models=None):
+        self.path = path or config.INFERENCE_SOCKET
+        self.num_workers = max(1, workers or config.INFERENCE_WORKERS)
+        self.models = SHARED_MODELS if models is None else list(models)
+        self.workers = {}  # pid -> worker index
+        self._sock = None
+        self._stopping = False
+
+    @property
+    def status_path(self):
+        return self.path + ".json"
+
+    def preload(self):
+        # Load and warm the models single-threaded: an OpenMP thread team
+        # created before fork() can deadlock the children. Workers set their
+        # own thread count after the fork.
+        try:
+            import torch
+
+            torch.set_num_threads(1)
+        except ImportError:
+            pass
+        import model_registry
+
+        if self.models:
+            model_registry.warmup(self.models)
+        if "embedder" in self.models:
+            from similarity import get_template_index
+
+            get_template_index()
+
+    def start(self):
+        # HF tokenizers refuse to use their thread pool after a fork
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        self.preload()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(config.INFERENCE_BACKLOG)
+        # Move everything allocated so far out of the collector's reach, so
+        # the workers' GC passes don't write to (and un-share) those pages
+        gc.collect()
+        gc.freeze()
+        for index in range(self.num_workers):
+            self._spawn(index)
+        self._write_status()
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._worker(index)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+
+    def _worker(self, index):
+        signal.signal(signal.SIGTERM, _stop_worker)
+        # Ctrl-C goes to the whole process group; the parent shuts the workers down
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        threads = config.INFERENCE_WORKER_THREADS or max(1, (os.cpu_count() or 1) // self.num_workers)
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        # The parent's metrics endpoint would only show the parent's registry
+        metrics.configure(port=metrics.worker_port(index))
+        while True:
+            conn, _ = self._sock.accept()
+            with conn:
+                conn.settimeout(config.INFERENCE_REQUEST_TIMEOUT)
+                try:
+                    request = recv_message(conn)
+                except (OSError, ValueError):
+                    continue
+                try:
+                    response = handle_request(request)
+                except Exception as exc:
+                    response = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+                try:
+                    send_message(conn, response)
+                except OSError:
+                    pass
+
+    def _write_status(self):
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "parent": os.getpid(),
+                "workers": {str(pid): index for pid, index in self.workers.items()},
+                "models": self.models,
+                "socket": self.path,
+            }, f)
+        os.replace(tmp, self.status_path)
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve_forever(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        self.start()
+        if self._stopping:
+            # Stopped while the models were loading
+            self.stop()
+            return
+        print(f"Serving {', '.join(self.models)} on {self.path} with {self.num_workers} worker(s)", file=sys.stderr)
+        try:
+            while self.workers:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                index = self.workers.pop(pid, None)
+                if index is None or self._stopping:
+                    continue
+                # Re-fork from the already loaded parent; no model load needed
+                print(f"Worker {index} (pid {pid}) exited with status {status}; restarting", file=sys.stderr)
+                time.sleep(1)
+                self._spawn(index)
+                self._write_status()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._handle_stop(None, None)
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.workers.clear()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        for path in (self.path, self.status_path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+# ---- Client ----
+
+class InferenceClient:
+    # One connection per request, so a client never pins a worker
+    def __init__(self, path=None, connect_timeout=None, timeout=None):
+        self.path = path or config.INFERENCE_SOCKET
+        self.connect_timeout = config.INFERENCE_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.timeout = config.INFERENCE_REQUEST_TIMEOUT if timeout is None else timeout
+
+    def request(self, op, texts=None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            try:
+                sock.connect(self.path)
+            except (socket.timeout, BlockingIOError) as exc:
+                metrics.incr("inference_client_rejected_total", op=op)
+                raise ServerBusy(f"inference server at {self.path} is busy") from exc
+            sock.settimeout(self.timeout)
+            send_message(sock, {"op": op, "texts": texts})
+            response = recv_message(sock)
+        finally:
+            sock.close()
+        if not response.get("ok"):
+            raise InferenceError(response.get("error"))
+        return response.get("results", response)
+
+    def _batched(self, op, texts):
+        texts = list(texts)
+        results = []
+        for start in range(0, len(texts), config.INFERENCE_MAX_BATCH):
+            results.extend(self.request(op, texts[start:start + config.INFERENCE_MAX_BATCH]))
+        return results
+
+    def ping(self):
+        return self.request("ping")
+
+    def classify_texts(self, texts):
+        return self._batched("classify", texts)
+
+    def classify_text(self, text):
+        return self.classify_texts([text])[0]
+
+    def compute_similarity(self, text):
+        score, matches = self._batched("similarity", [text])[0]
+        return score, matches
+
+    def get_entities_batch(self, texts):
+        return self._batched("entities", texts)
+
+    def get_entities(self, text):
+        return self.get_entities_batch([text])[0]
+
+    def grammar_check_batch(self, texts):
+        return [tuple(result) for result in self._batched("grammar", texts)]
+
+    def grammar_check(self, text):
+        return self.grammar_check_batch([text])[0]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient()
+        return _client
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-fork inference server with shared model memory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="load the models and serve them to pre-forked workers")
+    serve.add_argument("--socket", default=None, help="Unix socket path (default: SCAM_INFERENCE_SOCKET)")
+    serve.add_argument("--workers", type=int, default=None, help="worker processes (default: SCAM_INFERENCE_WORKERS)")
+    serve.add_argument("--models", default=None, help="comma-separated models to preload (default: %s)" % ",".join(SHARED_MODELS))
+    memory = sub.add_parser("memory", help="per-process RSS / PSS of a running server")
+    memory.add_argument("--socket", default=None, help="Unix socket path of the server")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        metrics.configure()
+        models = [name for name in args.models.split(",") if name] if args.models else None
+        InferenceServer(path=args.socket, workers=args.workers, models=models).serve_forever()
+    else:
+        report = memory_report((args.socket or config.INFERENCE_SOCKET) + ".json")
+        print(f"{'process':<10} {'pid':>8} {'rss_mb':>9} {'pss_mb':>9} {'shared_mb':>10} {'private_mb':>11}")
+        for name, row in report["processes"].items():
+            print(f"{name:<10} {row['pid']:>8} {row.get('rss_mb', '-'):>9} {row.get('pss_mb', '-'):>9} "
+                  f"{row.get('shared_mb', '-'):>10} {row.get('private_mb', '-'):>11}")
+        totals = report["totals"]
+        print(f"RSS sum {totals['rss_sum_mb']} MB (separate processes would need about this), "
+              f"PSS sum {totals['pss_sum_mb']} MB (actual)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,42 @@
-import re
-import tldextract
-import whois
+from domain_reputation import get_index
+from extraction import email_spans, extract_emails, url_spans
+from extraction import extract_urls as extract_links
+from whois_cache import get_resolver
 
-def extract_emails(text):
-    return re.findall(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+', text)
+def get_domain_info(domain, resolver=None):
+    # Domain age in years (cached), or None if it could not be determined
+    return (resolver or get_resolver()).resolve(domain)
 
-def extract_links(text):
-    return re.findall(r'(https?://[^\s]+)', text)
-
-def get_domain_info(domain):
-    try:
-        w = whois.whois(domain)
-        age = (2025 - int(str(w.creation_date[0].year))) if isinstance(w.creation_date, list) else 0
-        return age
-    except Exception:
-        return None
-
-def analyze_links_and_emails(text):
+def analyze_links_and_emails(text, resolver=None):
+    resolver = resolver or get_resolver()
     report = []
     emails = extract_emails(text)
     links = extract_links(text)
 
+    index = get_index()
+    email_domains = {
+        span["text"]: span["domain"] or span["host"]
+        for span in email_spans(text)
+        if not index.is_free_mail(span["host"])
+    }
+    link_domains = [span["domain"] for span in url_spans(text)]
+    # Look up every domain at once so the WHOIS calls run concurrently
+    ages = resolver.resolve_many(list(email_domains.values()) + link_domains)
+
     if not emails:
         report.append("⚠️ No email address found.")
     for email in emails:
-        if any(free in email for free in ["gmail.com", "yahoo.com", "outlook.com"]):
+        if email not in email_domains:
             report.append(f"🚩 Email uses free domain: {email}")
         else:
-            domain = email.split("@")[1]
-            age = get_domain_info(domain)
+            domain = email_domains[email]
+            age = ages.get(domain.lower())
             if age is not None and age < 2:
                 report.append(f"🚩 Email domain {domain} is less than 2 years old.")
     
-    for link in links:
-        domain = tldextract.extract(link).registered_domain
+    for domain in link_domains:
         if domain:
-            age = get_domain_info(domain)
+            age = ages.get(domain.lower())
             if age is not None and age < 2:
                 report.append(f"⚠️ Link points to a very new domain: {domain}")
 
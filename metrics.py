@@ -0,0 +1,265 @@
+# metrics.py
+
+# Lightweight instrumentation for the pipeline: timing spans, counters and
+# histograms, aggregated in-process and forwarded to pluggable sinks (log
+# lines, a Prometheus text endpoint or a callback). Also an opt-in sampling
+# profiler that dumps folded stacks for requests slower than a threshold.
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+logger = logging.getLogger("scam_detector.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [buckets, bucket_counts, sum, count]
+
+    def incr(self, name, value, labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels, buckets):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(hist[0]):
+                if value <= bound:
+                    hist[1][i] += 1
+            hist[2] += value
+            hist[3] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": {f"{n}{dict(l)}": v for (n, l), v in self.counters.items()},
+                "histograms": {
+                    f"{n}{dict(l)}": {"count": h[3], "sum": round(h[2], 6)}
+                    for (n, l), h in self.histograms.items()
+                },
+            }
+
+    def render_prometheus(self):
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"scam_{name}{fmt_labels(labels)} {value}")
+            for (name, labels), (buckets, counts, total, count) in sorted(self.histograms.items()):
+                for bound, c in zip(buckets, counts):
+                    lines.append(f"scam_{name}_bucket{fmt_labels(labels, [('le', bound)])} {c}")
+                lines.append(f"scam_{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"scam_{name}_sum{fmt_labels(labels)} {total}")
+                lines.append(f"scam_{name}_count{fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_sinks = []
+
+
+# ---- Sinks ----
+
+class LogSink:
+    def __init__(self, log=None, level=logging.INFO):
+        self.log = log or logger
+        self.level = level
+
+    def __call__(self, kind, name, value, labels):
+        self.log.log(self.level, "metric %s %s=%s %s", kind, name, value, labels)
+
+
+class CallbackSink:
+    # Wraps any fn(kind, name, value, labels)
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, kind, name, value, labels):
+        self.fn(kind, name, value, labels)
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_http_server = None
+_http_server_pid = None
+
+
+def start_http_server(port=None):
+    # Serve this process's registry in Prometheus text format on a daemon
+    # thread. A forked child inherits the parent's listening socket but not
+    # the thread serving it, so it drops that copy and starts its own. A port
+    # already in use is logged and skipped: metrics are never worth a crash.
+    global _http_server, _http_server_pid
+    if _http_server is not None and _http_server_pid != os.getpid():
+        _http_server.socket.close()
+        _http_server = None
+    if _http_server is None:
+        port = port or config.METRICS_PORT
+        try:
+            _http_server = ThreadingHTTPServer(("127.0.0.1", port), _PrometheusHandler)
+        except OSError as exc:
+            logger.warning("metrics endpoint not started on port %s: %s", port, exc)
+            return None
+        _http_server_pid = os.getpid()
+        threading.Thread(target=_http_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _http_server
+
+
+def worker_port(index):
+    # Worker processes serve their own registry on the ports after METRICS_PORT
+    return config.METRICS_PORT + 1 + index
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _emit(kind, name, value, labels):
+    for sink in list(_sinks):
+        try:
+            sink(kind, name, value, labels)
+        except Exception:
+            logger.exception("metrics sink failed")
+
+
+# ---- Recording ----
+
+def incr(name, value=1, **labels):
+    registry.incr(name, value, labels)
+    if _sinks:
+        _emit("counter", name, value, labels)
+
+
+def observe(name, value, buckets=SIZE_BUCKETS, **labels):
+    registry.observe(name, value, labels, buckets)
+    if _sinks:
+        _emit("histogram", name, value, labels)
+
+
+@contextmanager
+def span(name, **labels):
+    # Times the block into the `<name>_seconds` histogram
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(f"{name}_seconds", time.perf_counter() - start, buckets=LATENCY_BUCKETS, **labels)
+
+
+# ---- Sampling profiler ----
+
+class SlowRequestProfiler:
+    # Samples the stacks of all threads while a request runs; if the request
+    # ends up slower than the threshold the samples are written out in folded
+    # format (one "frame;frame;frame count" line per stack, flamegraph-ready).
+    def __init__(self, threshold=None, interval_ms=None, out_dir=None):
+        self.threshold = config.PROFILE_SLOW_SECONDS if threshold is None else threshold
+        self.interval = (interval_ms or config.PROFILE_INTERVAL_MS) / 1000.0
+        self.out_dir = out_dir or config.PROFILE_DIR
+
+    @contextmanager
+    def profile(self, label="request"):
+        if not self.threshold:
+            yield
+            return
+        samples = {}
+        stop = threading.Event()
+        own_ident = []
+
+        def sample():
+            own_ident.append(threading.get_ident())
+            names = {}
+            while not stop.wait(self.interval):
+                names.update({t.ident: t.name for t in threading.enumerate()})
+                for ident, frame in sys._current_frames().items():
+                    if ident in own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    folded = ";".join(reversed(stack))
+                    samples[folded] = samples.get(folded, 0) + 1
+
+        sampler = threading.Thread(target=sample, name="slow-request-profiler", daemon=True)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold and samples:
+                self._dump(label, elapsed, samples)
+
+    def _dump(self, label, elapsed, samples):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(samples.items(), key=lambda kv: -kv[1]):
+                f.write(f"{stack} {count}\n")
+        incr("slow_profiles_total")
+        logger.warning("slow %s (%.2fs), stack profile written to %s", label, elapsed, path)
+
+
+profiler = SlowRequestProfiler()
+
+
+def configure(port=None):
+    # Set up the sink chosen in config; safe to call more than once. Not run
+    # at import: the entry points (app, batch_scan, inference_server) call it,
+    # so only the processes meant to serve metrics bind a port, and worker
+    # processes pass their own (see worker_port).
+    if config.METRICS_SINK == "log" and not any(isinstance(s, LogSink) for s in _sinks):
+        # Nothing else configures logging, so without a handler INFO lines go nowhere
+        if not logger.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(message)s"))
+            logger.addHandler(handler)
+            logger.propagate = False
+        logger.setLevel(logging.INFO)
+        add_sink(LogSink())
+    elif config.METRICS_SINK == "prometheus":
+        start_http_server(port)
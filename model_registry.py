@@ -0,0 +1,94 @@
+# model_registry.py
+
+# Central registry for the heavy models. Nothing is loaded at import time:
+# each module registers a loader, the model is built on first use and cached
+# for the life of the process (imported modules, and so this cache, survive
+# Streamlit script reruns). warmup() loads models ahead of time and runs a
+# dummy inference so the first real request doesn't pay for it.
+import importlib
+import threading
+import time
+
+_IMPORTED_AT = time.perf_counter()
+
+# Model name -> module that registers it, so warmup() can pull in modules that
+# haven't been imported yet
+PROVIDERS = {
+    "classifier": "ai_model",
+    "embedder": "similarity",
+    "spacy": "spacy_pipeline",
+    "grammar": "grammar",
+}
+
+_loaders = {}   # name -> (loader, warmup)
+_models = {}
+_stats = {}     # name -> {"load_seconds": ..., "warmup_seconds": ...}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def register(name, loader, warmup=None):
+    # loader() builds the model; warmup(model) runs a throwaway inference
+    with _registry_lock:
+        _loaders[name] = (loader, warmup)
+        _locks.setdefault(name, threading.Lock())
+
+
+def _ensure_registered(name):
+    if name not in _loaders and name in PROVIDERS:
+        importlib.import_module(PROVIDERS[name])
+    if name not in _loaders:
+        raise KeyError(f"Unknown model: {name}")
+
+
+def get(name):
+    model = _models.get(name)
+    if model is not None:
+        return model
+    _ensure_registered(name)
+    with _locks[name]:
+        if name not in _models:
+            start = time.perf_counter()
+            _models[name] = _loaders[name][0]()
+            seconds = time.perf_counter() - start
+            _stats.setdefault(name, {})["load_seconds"] = round(seconds, 3)
+            import metrics
+
+            metrics.observe("model_load_seconds", seconds, buckets=metrics.LATENCY_BUCKETS, model=name)
+        return _models[name]
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def _warm(names):
+    for name in names:
+        model = get(name)
+        warm = _loaders[name][1]
+        if warm is not None and "warmup_seconds" not in _stats.get(name, {}):
+            start = time.perf_counter()
+            warm(model)
+            _stats[name]["warmup_seconds"] = round(time.perf_counter() - start, 3)
+
+
+def warmup(names=None, background=False):
+    # Load (and warm) the given models, or all known ones. With background=True
+    # this returns the started thread instead of blocking.
+    names = list(PROVIDERS if names is None else names)
+    if background:
+        thread = threading.Thread(target=_warm, args=(names,), name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+    _warm(names)
+    return None
+
+
+def report():
+    return {
+        "since_import_seconds": round(time.perf_counter() - _IMPORTED_AT, 3),
+        "models": {
+            name: {"loaded": name in _models, **_stats.get(name, {})}
+            for name in sorted(set(PROVIDERS) | set(_loaders))
+        },
+    }
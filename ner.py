@@ -1,10 +1,13 @@
-import spacy
+from extraction import extract
+from spacy_pipeline import parse, parse_many
 
-# Load the spaCy English NER model
-nlp = spacy.load("en_core_web_sm")
 
-def get_entities(text):
-    doc = nlp(text)
+def get_entities(text, doc=None, spans=None):
+    # Reuse an already parsed Doc / extracted spans when the caller has them
+    if doc is None:
+        doc = parse(text)
+    if spans is None:
+        spans = extract(text)
     # Return ORG (organization), PERSON, and other useful entity types
     entities = {
         "ORG": [],
@@ -18,12 +21,14 @@ def get_entities(text):
     for ent in doc.ents:
         if ent.label_ in entities:
             entities[ent.label_].append(ent.text)
-    # SpaCy doesn’t extract emails/urls by default, so use regex as backup
-    import re
-    emails = re.findall(r'\b[\w\.-]+@[\w\.-]+\.\w+\b', text)
-    urls = re.findall(r'https?://\S+', text)
-    if emails:
-        entities["EMAIL"].extend(emails)
-    if urls:
-        entities["URL"].extend(urls)
+    # SpaCy doesn’t extract emails/urls by default, so take them from the shared extraction
+    for span in spans:
+        entities["EMAIL" if span["kind"] == "email" else "URL"].append(span["text"])
     return entities
+
+
+def get_entities_batch(texts, n_process=None, batch_size=None):
+    # Bulk version of get_entities running over nlp.pipe
+    texts = list(texts)
+    docs = parse_many(texts, n_process=n_process, batch_size=batch_size)
+    return [get_entities(text, doc=doc) for text, doc in zip(texts, docs)]
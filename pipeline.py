@@ -0,0 +1,497 @@
+# pipeline.py
+
+# Reusable orchestrator for the multi-layer analysis. Independent stages run
+# concurrently on a shared thread pool (the model calls release the GIL), a
+# stage starts as soon as the stages it depends on have finished, and every
+# stage has its own timeout. A stage that fails or times out is replaced by a
+# neutral default so the rest of the analysis still completes.
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import config
+import metrics
+import model_registry
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), default=None, feature=False):
+        self.name = name
+        self.func = func          # func(text, outputs) -> stage output
+        self.deps = tuple(deps)
+        self.default = default    # used when the stage fails or times out
+        self.feature = feature    # only computed for other stages; skipped when nothing needs it
+
+    @property
+    def timeout(self):
+        return config.PIPELINE_STAGE_TIMEOUTS.get(self.name, 60)
+
+
+# ---- Stage implementations ----
+
+def run_rules(text, outputs):
+    from rules import highlight_text, scan_text, triggered_rules
+
+    matches = scan_text(text, spans=outputs["extraction"])
+    return {
+        "flags": [rule["name"] for rule in triggered_rules(matches)],
+        "matches": matches,
+        "highlighted": highlight_text(text, matches),
+    }
+
+
+def run_extraction(text, outputs):
+    from extraction import extract
+
+    return extract(text)
+
+
+def run_embedding(text, outputs):
+    from similarity import embed_message
+
+    return embed_message(text)
+
+
+def _server():
+    # Client for inference_server.py when the models are served out of process
+    from inference_server import get_client
+
+    return get_client()
+
+
+def local_models():
+    # Models this process runs itself (what to warm up). With the inference
+    # server on, the classifier, spaCy and LanguageTool are only called through
+    # it; the embedder stays local when the learned head needs the embedding.
+    if not config.USE_INFERENCE_SERVER:
+        return list(model_registry.PROVIDERS)
+    return ["embedder"] if config.CLASSIFIER_MODE != "bart" else []
+
+
+def run_classifier(text, outputs):
+    embedding = outputs.get("embedding")
+    if config.CLASSIFIER_MODE == "fast" and embedding is not None:
+        from fast_classifier import classify_embedding
+
+        return classify_embedding(embedding["vector"])
+    if config.CLASSIFIER_MODE == "prescreen" and embedding is not None:
+        try:
+            from fast_classifier import classify_embedding
+
+            result = classify_embedding(embedding["vector"])
+        except Exception:
+            # No (or a stale) trained head: prescreening is only a shortcut, so use BART
+            metrics.incr("fast_head_failures_total")
+            result = None
+        if result is not None and result["score"] >= config.PRESCREEN_CONFIDENCE:
+            return result
+    if config.USE_INFERENCE_SERVER:
+        return _server().classify_text(text)
+    from ai_model import classify_text
+
+    return classify_text(text)
+
+
+def run_links(text, outputs):
+    from verification import check_email_domain, check_link
+
+    spans = outputs["extraction"]
+    emails = [span["text"] for span in spans if span["kind"] == "email"]
+    urls = [span["text"] for span in spans if span["kind"] == "url"]
+    email_warnings = []
+    link_warnings = []
+    checked = set()
+    for span in spans:
+        if span["text"] in checked:
+            continue
+        checked.add(span["text"])
+        # Check every email address and URL in the text
+        if span["kind"] == "email":
+            ok, message = check_email_domain(span["text"], span=span)
+            if not ok:
+                email_warnings.append(f"**Email:** {span['text']} – {message}")
+        else:
+            ok, message = check_link(span["text"], span=span)
+            if not ok:
+                link_warnings.append(f"**Link:** {span['text']} – {message}")
+    return {
+        "emails": emails,
+        "urls": urls,
+        "email_warnings": email_warnings,
+        "link_warnings": link_warnings,
+    }
+
+
+def run_entities(text, outputs):
+    if config.USE_INFERENCE_SERVER:
+        return _server().get_entities(text)
+    from ner import get_entities
+    from spacy_pipeline import parse
+
+    return get_entities(text, doc=parse(text), spans=outputs["extraction"])
+
+
+def run_mismatch(text, outputs):
+    entities = outputs["entities"]
+    domains = [span["host"] for span in outputs["extraction"] if span["kind"] == "email"]
+    warnings = []
+    # If an ORG is mentioned and the sender's email domain is different, flag it
+    for org in entities.get("ORG", []):
+        # simple check: does org name appear in any email domain?
+        org_name = org.lower().replace(",", "")
+        match_found = any(org_name in domain for domain in domains)
+        if not match_found and domains:
+            warnings.append(f"Organization **{org}** is mentioned, but sender's email domain doesn’t match **{org}**.")
+    return {"warnings": warnings}
+
+
+def run_grammar(text, outputs):
+    if config.USE_INFERENCE_SERVER:
+        score, issues = _server().grammar_check(text)
+        return {"score": score, "issues": issues}
+    from grammar import grammar_check
+
+    score, issues = grammar_check(text)
+    return {"score": score, "issues": issues}
+
+
+def run_similarity(text, outputs):
+    if config.USE_INFERENCE_SERVER and outputs.get("embedding") is None:
+        score, matches = _server().compute_similarity(text)
+        return {"score": score, "matches": matches}
+    from similarity import compute_similarity
+
+    score, matches = compute_similarity(text, embedding=outputs.get("embedding"))
+    return {"score": score, "matches": matches}
+
+
+STAGES = [
+    Stage("rules", run_rules, deps=("extraction",), default={"flags": [], "matches": [], "highlighted": ""}),
+    # Email/URL spans with their hosts and registered domains, extracted once for every stage that needs them
+    Stage("extraction", run_extraction, default=(), feature=True),
+    # The MiniLM message embedding, computed once for similarity and (in fast/prescreen mode) the classifier
+    Stage("embedding", run_embedding, default=None, feature=True),
+    Stage("classifier", run_classifier, deps=("embedding",) if config.CLASSIFIER_MODE != "bart" else (),
+          default={"label": "Unknown", "score": 0.0, "scores": {}}),
+    Stage("links", run_links, deps=("extraction",),
+          default={"emails": [], "urls": [], "email_warnings": [], "link_warnings": []}),
+    Stage("entities", run_entities, deps=("extraction",), default={}),
+    Stage("mismatch", run_mismatch, deps=("entities", "extraction"), default={"warnings": []}),
+    Stage("grammar", run_grammar, default=None),
+    # With the inference server the embedding is computed there (unless the classifier head needs it here)
+    Stage("similarity", run_similarity,
+          deps=("embedding",) if not config.USE_INFERENCE_SERVER or config.CLASSIFIER_MODE != "bart" else (),
+          default=None),
+]
+
+
+# ---- Scoring ----
+
+# The weights and thresholds live in verdict.py / data/scoring.json; the
+# helpers here score a single message through the same vectorized model.
+
+def verdict_for(final_score):
+    from verdict import get_scoring_model
+
+    return get_scoring_model().verdict_for(final_score)
+
+
+def score_analysis(outputs):
+    # Turns the stage outputs into (final_score, verdict, reasons).
+    # Stages that were degraded or haven't run (output None/missing) add nothing to the score.
+    from verdict import features_from_outputs, score_batch
+
+    defaults = {stage.name: stage.default for stage in STAGES}
+    outputs = {name: outputs.get(name, defaults[name]) for name in defaults}
+    reasons = []
+    for flag in outputs["rules"]["flags"]:
+        reasons.append(f"Red flag: {flag}")
+    for warn in outputs["links"]["email_warnings"]:
+        reasons.append(f"Email warning: {warn}")
+    for warn in outputs["links"]["link_warnings"]:
+        reasons.append(f"Link warning: {warn}")
+    for warn in outputs["mismatch"]["warnings"]:
+        reasons.append(f"Entity mismatch: {warn}")
+
+    scores, verdicts = score_batch(features_from_outputs(outputs))
+    return int(scores[0]), verdicts[0], reasons
+
+
+# ---- Scheduler ----
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.PIPELINE_WORKERS, thread_name_prefix="pipeline")
+        return _executor
+
+
+def _timed(stage, text, outputs):
+    start = time.perf_counter()
+    value = stage.func(text, outputs)
+    return value, time.perf_counter() - start
+
+
+def run_stages(text, stages, outputs=None, on_stage=None, stop=None):
+    # Runs `stages` respecting their dependencies. `outputs` may already hold
+    # results of earlier stages. on_stage(name, output, status, seconds) is
+    # called from the calling thread as each stage finishes, in completion order.
+    # stop(outputs, pending_names) is checked after each finished stage; when it
+    # returns True the pending stages are abandoned (cancelled if not started
+    # yet) and left out of the returned outputs and status.
+    outputs = dict(outputs or {})
+    status = {}
+    timings = {}
+    executor = get_executor()
+    waiting = list(stages)
+    running = {}  # future -> (stage, deadline)
+
+    def finish(stage, value, stage_status, seconds):
+        metrics.incr("stage_runs_total", stage=stage.name, status=stage_status)
+        metrics.observe("stage_seconds", seconds, buckets=metrics.LATENCY_BUCKETS, stage=stage.name)
+        outputs[stage.name] = value
+        status[stage.name] = stage_status
+        timings[stage.name] = seconds
+        if on_stage is not None:
+            on_stage(stage.name, value, stage_status, seconds)
+
+    while waiting or running:
+        for stage in list(waiting):
+            if all(dep in outputs for dep in stage.deps):
+                waiting.remove(stage)
+                # Snapshot so a stage only sees the outputs that existed when it started
+                future = executor.submit(_timed, stage, text, dict(outputs))
+                running[future] = (stage, time.monotonic() + stage.timeout, time.perf_counter())
+
+        if not running:
+            # Remaining stages depend on something that will never run
+            for stage in waiting:
+                finish(stage, stage.default, "skipped", 0.0)
+            break
+
+        next_deadline = min(deadline for _, deadline, _ in running.values())
+        done, _ = wait(list(running), timeout=max(0.0, next_deadline - time.monotonic()),
+                       return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, _, _ = running.pop(future)
+            try:
+                value, seconds = future.result()
+                finish(stage, value, "ok", seconds)
+            except Exception:
+                finish(stage, stage.default, "error", 0.0)
+        if stop is not None and done and (waiting or running):
+            pending = [stage.name for stage in waiting] + [stage.name for stage, _, _ in running.values()]
+            if stop(outputs, pending):
+                for future in running:
+                    future.cancel()
+                break
+        now = time.monotonic()
+        for future, (stage, deadline, started) in list(running.items()):
+            if deadline <= now:
+                # The thread keeps running in the background; we just stop waiting for it
+                running.pop(future)
+                finish(stage, stage.default, "timeout", time.perf_counter() - started)
+
+    return outputs, status, timings
+
+
+# ---- Cascade ----
+
+# Cheap checks first, then the classifier, then the remaining models. After
+# each tier the score is bounded by what the stages still to run could add;
+# if the verdict is the same at both ends of that range they are skipped.
+CASCADE_TIERS = [
+    ("rules", "links"),
+    ("entities", "mismatch", "classifier"),
+    ("grammar", "similarity"),
+]
+
+
+class CascadeStats:
+    # `publish` also counts into metrics; off for totals re-aggregated from
+    # other processes (batch_scan), which already published their own
+    def __init__(self, publish=True):
+        self._lock = threading.Lock()
+        self.publish = publish
+        self.runs = 0
+        self.early_exits = 0
+        self.skipped = {}          # stage -> times skipped
+        self.audits = 0
+        self.audit_agreements = 0
+
+    def record(self, skipped, audited=False, agreed=True):
+        with self._lock:
+            self.runs += 1
+            if skipped:
+                self.early_exits += 1
+            for name in skipped:
+                self.skipped[name] = self.skipped.get(name, 0) + 1
+            if audited:
+                self.audits += 1
+                self.audit_agreements += int(agreed)
+        if self.publish:
+            metrics.incr("cascade_runs_total")
+            if skipped:
+                metrics.incr("cascade_early_exits_total")
+            if audited:
+                metrics.incr("cascade_audits_total", agreed=str(bool(agreed)).lower())
+
+    def report(self):
+        with self._lock:
+            # Feature stages only run on behalf of other stages, so the rate
+            # is over the stages that can actually be skipped
+            skippable = [stage.name for stage in STAGES if not stage.feature]
+            stage_runs = self.runs * len(skippable)
+            skipped = sum(self.skipped.get(name, 0) for name in skippable)
+            return {
+                "runs": self.runs,
+                "early_exits": self.early_exits,
+                "skipped": dict(self.skipped),
+                "skip_rate": skipped / stage_runs if stage_runs else 0.0,
+                "audits": self.audits,
+                "audit_agreement": self.audit_agreements / self.audits if self.audits else None,
+            }
+
+
+cascade_stats = CascadeStats()
+
+
+def verdict_settled(outputs, remaining):
+    # True when no result of the `remaining` stages can move the verdict
+    from verdict import features_from_outputs, get_scoring_model
+
+    model = get_scoring_model()
+    maxima = model.stage_max_contribution()
+    features = features_from_outputs(outputs)
+    low = model.scores(features)[0]
+    high = model.scores(features, extra=sum(maxima.get(name, 0) for name in remaining))[0]
+    return model.verdict_for(low) == model.verdict_for(high)
+
+
+def _run_cascade(text, stages, outputs, on_stage):
+    status = {}
+    timings = {}
+    todo = {stage.name: stage for stage in stages}
+    tiers = [list(tier) for tier in CASCADE_TIERS]
+    if config.CASCADE_SPECULATIVE and len(tiers) > 2:
+        # The first tier is cheap and runs alone; the rest start together and
+        # are abandoned once the verdict is settled
+        tiers = [tiers[0], [name for tier in tiers[1:] for name in tier]]
+
+    def settled(outputs, pending):
+        # The later tiers could still add to the score too
+        return verdict_settled(outputs, list(pending) + list(todo))
+
+    for tier in tiers:
+        if verdict_settled(outputs, todo):
+            break
+        tier_stages = [todo.pop(name) for name in tier if name in todo]
+        # Feature stages aren't tiered; they run with the first tier that needs them
+        for dep in {dep for stage in tier_stages for dep in stage.deps}:
+            if dep in todo and todo[dep].feature:
+                tier_stages.append(todo.pop(dep))
+        outputs, tier_status, tier_timings = run_stages(text, tier_stages, outputs=outputs, on_stage=on_stage,
+                                                        stop=settled)
+        status.update(tier_status)
+        timings.update(tier_timings)
+        # Stages abandoned on an early exit inside the tier are skipped below
+        for stage in tier_stages:
+            if stage.name not in tier_status:
+                todo[stage.name] = stage
+    # Anything not in a tier (or left after an early exit) is skipped
+    skipped = list(todo.values())
+    for stage in skipped:
+        metrics.incr("stage_runs_total", stage=stage.name, status="skipped")
+        outputs[stage.name] = stage.default
+        status[stage.name] = "skipped"
+        timings[stage.name] = 0.0
+        if on_stage is not None:
+            on_stage(stage.name, stage.default, "skipped", 0.0)
+    return outputs, status, timings, skipped
+
+
+def run_pipeline(text, on_stage=None, cache=None, cascade=None, stages=None):
+    # Traced entry point; see _run_pipeline
+    metrics.observe("input_chars", len(text))
+    with metrics.profiler.profile("pipeline"), metrics.span("pipeline"):
+        return _run_pipeline(text, on_stage, cache, cascade, stages)
+
+
+def _run_pipeline(text, on_stage=None, cache=None, cascade=None, stages=None):
+    # cache: a result_cache.ResultCache, False to bypass it, or None for the
+    # process-wide cache (when enabled in config)
+    # cascade: skip expensive stages once the verdict is settled; None uses
+    # config.CASCADE_ENABLED, False always runs every stage (audits)
+    # stages: replacement implementations of STAGES (same names), e.g. the
+    # memoized ones from incremental.py
+    from result_cache import CACHED_STAGES, get_result_cache
+
+    start = time.perf_counter()
+    if cache is None and config.RESULT_CACHE_ENABLED:
+        cache = get_result_cache()
+    if cascade is None:
+        cascade = bool(config.CASCADE_ENABLED)
+
+    cached = {}
+    cache_hit = None
+    if cache:
+        cached, cache_hit = cache.lookup(text)
+        cached = cached or {}
+        for name, value in cached.items():
+            if on_stage is not None:
+                on_stage(name, value, "cached", 0.0)
+
+    stages = [stage for stage in stages or STAGES if stage.name not in cached]
+    # Feature stages only run when a stage that still has to run needs them
+    needed = {dep for stage in stages for dep in stage.deps}
+    stages = [stage for stage in stages if not stage.feature or stage.name in needed]
+    if cascade:
+        outputs, status, timings, skipped = _run_cascade(text, stages, dict(cached), on_stage)
+        audited = bool(skipped) and random.random() < config.CASCADE_AUDIT_RATE
+        agreed = True
+        if audited:
+            # Run what was skipped anyway and check the verdict didn't change
+            cascade_verdict = score_analysis(outputs)[1]
+            # Drop the defaults filled in for the skipped stages, or the ones
+            # depending on them would start right away on a placeholder
+            skipped_names = {stage.name for stage in skipped}
+            kept = {name: value for name, value in outputs.items() if name not in skipped_names}
+            outputs, audit_status, audit_timings = run_stages(text, skipped, outputs=kept)
+            status.update(audit_status)
+            timings.update(audit_timings)
+            agreed = score_analysis(outputs)[1] == cascade_verdict
+        cascade_info = {"skipped": [stage.name for stage in skipped], "audited": audited, "agreed": agreed}
+        cascade_stats.record(**cascade_info)
+    else:
+        cascade_info = None
+        outputs, status, timings = run_stages(text, stages, outputs=cached, on_stage=on_stage)
+    for name in cached:
+        status[name] = "cached"
+        timings[name] = 0.0
+
+    if cache and not cache_hit and all(status.get(name) == "ok" for name in CACHED_STAGES):
+        cache.store(text, outputs)
+
+    from verdict import features_from_outputs, features_to_dict
+
+    final_score, verdict, reasons = score_analysis(outputs)
+    return {
+        "outputs": outputs,
+        "status": status,
+        "timings": timings,
+        "cache_hit": cache_hit,
+        "score": final_score,
+        "verdict": verdict,
+        "reasons": reasons,
+        # What the score was computed from, so verdicts can be re-scored without the models
+        "features": features_to_dict(features_from_outputs(outputs)),
+        # Stages the cascade skipped (their features are None unless audited)
+        "cascade": cascade_info,
+        "elapsed": time.perf_counter() - start,
+    }
@@ -0,0 +1,248 @@
+# result_cache.py
+
+# Result cache for mass-mailed campaigns. Messages are normalized (case,
+# whitespace, URLs, emails and numbers) and looked up first by exact hash and
+# then by SimHash, so copies that only differ in names, amounts or tracking
+# links reuse the expensive model outputs.
+#
+# SimHash over single words barely moves when a few sentences are added to a
+# long message, so a near hit is confirmed before reuse: the messages' word
+# 3-shingle sets must be close (estimated from bottom-k sketches) and both must
+# trigger the same red-flag rules. Keys include the model configuration, so a
+# persisted cache isn't served after switching models or backends.
+import hashlib
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import config
+import metrics
+
+# Stages whose outputs are reused on a hit; cheap per-message checks always rerun
+CACHED_STAGES = ("classifier", "grammar", "similarity")
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"[\w\.+-]+@[\w\.-]+\.\w+")
+_NUMBER_RE = re.compile(r"\d[\d,\.]*")
+_TOKEN_RE = re.compile(r"\w+|<\w+>")
+
+_BANDS = 8
+_BAND_BITS = 64 // _BANDS
+_SHINGLE = 3
+_SKETCH_SIZE = 64
+
+
+def normalize(text):
+    text = text.lower()
+    text = _URL_RE.sub(" <url> ", text)
+    text = _EMAIL_RE.sub(" <email> ", text)
+    text = _NUMBER_RE.sub(" <num> ", text)
+    return " ".join(text.split())
+
+
+def _hash64(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(normalized):
+    # 64-bit SimHash over word tokens. Single words (rather than shingles) keep
+    # a swapped name or amount down to a couple of differing bits.
+    weights = [0] * 64
+    for token in _TOKEN_RE.findall(normalized):
+        h = _hash64(token)
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def _bands(value):
+    mask = (1 << _BAND_BITS) - 1
+    return [(i, value >> (i * _BAND_BITS) & mask) for i in range(_BANDS)]
+
+
+def sketch(normalized):
+    # Bottom-k sketch: the smallest hashes of the word 3-shingles
+    tokens = _TOKEN_RE.findall(normalized)
+    shingles = {" ".join(tokens[i:i + _SHINGLE]) for i in range(max(1, len(tokens) - _SHINGLE + 1))}
+    return tuple(heapq.nsmallest(_SKETCH_SIZE, {_hash64(s) for s in shingles}))
+
+
+def resemblance(a, b):
+    # Estimated Jaccard similarity of two shingle sets from their sketches
+    # (exact when both messages have at most _SKETCH_SIZE shingles)
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    both = set(a) & set(b)
+    union = heapq.nsmallest(_SKETCH_SIZE, set(a) | set(b))
+    return sum(1 for h in union if h in both) / len(union)
+
+
+def rule_signature(text):
+    # Red-flag rules the message triggers; cheap, and exactly what an appended
+    # scam payload changes
+    from rules import scan_text
+
+    return tuple(sorted({m["rule_id"] for m in scan_text(text)}))
+
+
+def config_tag():
+    # Everything that changes the cached stages' outputs
+    return "|".join(str(value) for value in (
+        config.CLASSIFIER_MODEL, config.CLASSIFIER_MODE, config.SIMILARITY_MODEL,
+        config.INFERENCE_BACKEND, config.GRAMMAR_LANGUAGE, config.CHUNK_PREFILTER,
+    ))
+
+
+def fingerprint(text):
+    normalized = normalize(text)
+    key = hashlib.sha1((config_tag() + "\0" + normalized).encode("utf-8")).hexdigest()
+    return key, simhash(normalized)
+
+
+class ResultCache:
+    def __init__(self, max_entries=None, path=None, max_distance=None, min_resemblance=None):
+        self.max_entries = max_entries or config.RESULT_CACHE_SIZE
+        self.max_distance = config.RESULT_CACHE_MAX_DISTANCE if max_distance is None else max_distance
+        self.min_resemblance = config.RESULT_CACHE_MIN_RESEMBLANCE if min_resemblance is None else min_resemblance
+        self._entries = OrderedDict()  # exact key -> (simhash, sketch, rule signature, outputs)
+        self._bands = {}               # (band, value) -> set of exact keys
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.near_rejected = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results_v2 ("
+                "key TEXT PRIMARY KEY, config TEXT NOT NULL, simhash TEXT NOT NULL, sketch TEXT NOT NULL, "
+                "rules TEXT NOT NULL, outputs TEXT NOT NULL, seq INTEGER NOT NULL)"
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, simhash, sketch, rules, outputs FROM results_v2 WHERE config = ? "
+                "ORDER BY seq DESC LIMIT ?", (config_tag(), self.max_entries)
+            ).fetchall()
+            for key, sh, sk, rules, outputs in reversed(rows):
+                self._add(key, int(sh, 16), tuple(int(h, 16) for h in json.loads(sk)),
+                          tuple(json.loads(rules)), json.loads(outputs))
+
+    def _add(self, key, sh, sk, rules, outputs):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._entries[key] = (sh, sk, rules, outputs)
+            return
+        self._entries[key] = (sh, sk, rules, outputs)
+        for band in _bands(sh):
+            self._bands.setdefault(band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, (old_sh, _, _, _) = self._entries.popitem(last=False)
+            for band in _bands(old_sh):
+                keys = self._bands.get(band)
+                if keys is not None:
+                    keys.discard(old_key)
+                    if not keys:
+                        del self._bands[band]
+
+    def lookup(self, text):
+        # Returns (outputs, kind) where kind is "exact", "near" or None
+        key, sh = fingerprint(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                metrics.incr("result_cache_lookups_total", result="exact")
+                return entry[3], "exact"
+            # With 8 bands and a distance of at most 7, a near-duplicate shares at least one band
+            candidates = {}
+            for band in _bands(sh):
+                for candidate in self._bands.get(band, ()):
+                    distance = bin(self._entries[candidate][0] ^ sh).count("1")
+                    if distance <= self.max_distance:
+                        candidates[candidate] = distance
+        if not candidates:
+            return self._miss()
+
+        # Confirm outside the lock (the rule scan isn't free), closest first
+        sk = sketch(normalize(text))
+        rules = rule_signature(text)
+        with self._lock:
+            for candidate in sorted(candidates, key=candidates.get):
+                entry = self._entries.get(candidate)
+                if entry is None or entry[2] != rules or resemblance(entry[1], sk) < self.min_resemblance:
+                    continue
+                self._entries.move_to_end(candidate)
+                self.near_hits += 1
+                metrics.incr("result_cache_lookups_total", result="near")
+                return entry[3], "near"
+            # Counted as a miss too
+            self.near_rejected += 1
+            self.misses += 1
+        metrics.incr("result_cache_lookups_total", result="near_rejected")
+        return None, None
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        metrics.incr("result_cache_lookups_total", result="miss")
+        return None, None
+
+    def store(self, text, outputs):
+        key, sh = fingerprint(text)
+        sk = sketch(normalize(text))
+        rules = rule_signature(text)
+        outputs = {name: outputs[name] for name in CACHED_STAGES if name in outputs}
+        with self._lock:
+            self._add(key, sh, sk, rules, outputs)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results_v2 (key, config, simhash, sketch, rules, outputs, seq) VALUES "
+                    "(?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM results_v2))",
+                    (key, config_tag(), format(sh, "016x"), json.dumps([format(h, "016x") for h in sk]),
+                     json.dumps(rules), json.dumps(outputs)),
+                )
+                self._db.execute(
+                    "DELETE FROM results_v2 WHERE seq <= (SELECT MAX(seq) FROM results_v2) - ?", (self.max_entries,)
+                )
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "near_rejected": self.near_rejected,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(path=config.RESULT_CACHE_PATH or None)
+        return _cache
@@ -1,24 +1,164 @@
 # rules.py
 
-# Simple example patterns, you can add more
-red_flag_rules = {
-    "Urgency": r"urgent|immediately|asap|24 hours|limited time",
-    "Request for Sensitive Info": r"bank account|passport|driver'?s license|id card|social security",
-    "Unusual Payment": r"bitcoin|gift card|crypto|western union|moneygram",
-    "Unprofessional Email": r"@gmail\.com|@yahoo\.com|@hotmail\.com",
-    "Upfront Payment Promise": r"initial payment|payment upfront|advance payment",
-    # ...add more as you wish
-}
-
-# Function to scan text and return flags triggered
+# Red-flag rules are loaded from a data file (see data/red_flag_rules.json) and
+# compiled once into a single alternation of named groups, so a message is
+# scanned in one pass no matter how many rules there are. A rule with a
+# "domain_list" instead of a pattern matches the email addresses (from
+# extraction.py) whose domain is on that list of the domain reputation index.
+# It is a separate pass over the addresses so the address spans can't swallow
+# the matches of pattern rules ("asap@gmail.com").
+#
+# A match consumes its text, so a rule overlapping another one's match ("gift
+# card" / "card number") is missed by the first pass. The rules not hit yet are
+# then scanned again (one alternation of just those) until a pass finds
+# nothing new, so a rule fires exactly when re.search would find it. With
+# non-overlapping rules that second pass finds nothing and ends right away.
+import html
+import json
 import re
 
+import config
+
+
+def load_rules(path=None):
+    with open(path or config.RULES_PATH, encoding="utf-8") as f:
+        rules = json.load(f)
+    for rule in rules:
+        rule.setdefault("weight", 15)
+    return rules
+
+
+class RuleEngine:
+    def __init__(self, rules):
+        self.rules = rules
+        self._by_group = {}
+        self._domain_rules = []
+        self._alternations = {}  # tuple of groups -> compiled alternation of those rules
+        parts = []
+        for i, rule in enumerate(rules):
+            if "pattern" not in rule:
+                if not rule.get("domain_list"):
+                    raise ValueError(f"Rule {rule['id']!r} needs a pattern or a domain_list")
+                self._domain_rules.append(rule)
+                continue
+            # Check each pattern on its own first so a bad rule is reported by id
+            re.compile(rule["pattern"])
+            group = f"r{i}"
+            self._by_group[group] = rule
+            parts.append(f"(?P<{group}>{rule['pattern']})")
+        self._pattern = re.compile("|".join(parts) or r"(?!)", re.IGNORECASE)
+
+    def _alternation(self, groups):
+        pattern = self._alternations.get(groups)
+        if pattern is None:
+            if len(self._alternations) >= 256:
+                self._alternations.clear()
+            pattern = re.compile(
+                "|".join(f"(?P<{g}>{self._by_group[g]['pattern']})" for g in groups), re.IGNORECASE
+            )
+            self._alternations[groups] = pattern
+        return pattern
+
+    def scan(self, text, spans=None):
+        # Matches in text order. `spans` are extraction.extract(text) spans,
+        # computed here when not given.
+        matches = []
+        pattern = self._pattern
+        remaining = set(self._by_group)
+        while True:
+            hit = set()
+            for m in pattern.finditer(text):
+                if m.start() == m.end():
+                    continue
+                hit.add(m.lastgroup)
+                matches.append(_match(self._by_group[m.lastgroup], m.start(), m.end()))
+            remaining -= hit
+            if not hit or not remaining:
+                break
+            # Rules not hit yet, in file order
+            pattern = self._alternation(tuple(g for g in self._by_group if g in remaining))
+        if len(matches) > 1:
+            matches.sort(key=lambda m: (m["start"], m["end"]))
+        if self._domain_rules:
+            if spans is None:
+                from extraction import extract
+
+                spans = extract(text)
+            for span in spans:
+                if span["kind"] != "email":
+                    continue
+                for rule in self._domain_rules:
+                    if _on_domain_list(span["host"], rule["domain_list"]):
+                        # From the "@", like the old "@gmail\.com" pattern matched
+                        at = span["start"] + span["text"].rindex("@")
+                        matches.append(_match(rule, at, span["end"]))
+            matches.sort(key=lambda m: (m["start"], m["end"]))
+        return matches
+
+
+def _match(rule, start, end):
+    return {
+        "rule_id": rule["id"],
+        "name": rule["name"],
+        "weight": rule["weight"],
+        "start": start,
+        "end": end,
+    }
+
+
+def _on_domain_list(domain, category):
+    from domain_reputation import get_index
+
+    return get_index().match(domain, category) is not None
+
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine(load_rules())
+    return _engine
+
+
+# {"rule name": regex pattern}, kept for callers that want the raw patterns
+# (rules matched against a domain list have no pattern)
+red_flag_rules = {rule["name"]: rule["pattern"] for rule in get_engine().rules if "pattern" in rule}
+
+
+def scan_text(text, spans=None):
+    return get_engine().scan(text, spans)
+
+
+def triggered_rules(matches):
+    # Triggered rules in rule-file order, each listed once
+    hit = {m["rule_id"] for m in matches}
+    return [rule for rule in get_engine().rules if rule["id"] in hit]
+
+
+def highlight_text(text, matches):
+    # Build the highlighted HTML from the match spans (sorted by start) in
+    # one linear pass; overlapping spans are clipped so nothing is highlighted twice
+    out = []
+    pos = 0
+    for m in matches:
+        start = max(m["start"], pos)
+        if m["end"] <= start:
+            continue
+        out.append(html.escape(text[pos:start]))
+        out.append(f"<span class='red-highlight'>{html.escape(text[start:m['end']])}</span>")
+        pos = m["end"]
+    out.append(html.escape(text[pos:]))
+    return "".join(out)
+
+
+# Function to scan text and return flags triggered
 def evaluate_text(text):
     score = 0
     red_flags = []
-    for rule in red_flag_rules:
-        if re.search(rule["pattern"], text, re.IGNORECASE):
-            red_flags.append(rule["reason"])
-            score += 15  # You can adjust weight per rule if you want
+    for rule in triggered_rules(scan_text(text)):
+        red_flags.append(rule["name"])
+        score += rule["weight"]
     score = min(score, 100)
     return score, red_flags
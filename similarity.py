@@ -1,6 +1,15 @@
-from sentence_transformers import SentenceTransformer, util
+import hashlib
+import json
+import os
+import tempfile
+import threading
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+import numpy as np
+
+import config
+import metrics
+import model_registry
+from chunking import chunk_text, chunk_weights
 
 job_templates = [
     "We are hiring for a remote data entry position. No experience required.",
@@ -8,20 +17,233 @@ job_templates = [
     "Dear Applicant, we would like to offer you a position at our company."
 ]
 
-def compute_similarity(text):
-    # Embed input text
-    text_emb = model.encode(text, convert_to_tensor=True)
-    # Embed templates
-    template_embs = model.encode(job_templates, convert_to_tensor=True)
-    # Compute cosine similarities
-    similarities = util.pytorch_cos_sim(text_emb, template_embs)[0].cpu().numpy()
 
-    avg_score = float(similarities.mean()) * 100
-    best_score = float(similarities.max()) * 100
+def _load_model():
+    from backends import load_embedder
+
+    # fp32, int8 or ONNX depending on config.INFERENCE_BACKEND
+    return load_embedder()
+
+
+model_registry.register("embedder", _load_model, warmup=lambda m: m.encode(["Warmup message."]))
+
+
+def get_model():
+    return model_registry.get("embedder")
+
+
+# Template labels marking known scams (see fast_classifier.LABEL_ALIASES)
+SCAM_TEMPLATE_LABELS = {"scam", "phishing", "phishing/scam email"}
+
+
+def is_scam_template(template):
+    return str(template.get("label") or "").lower() in SCAM_TEMPLATE_LABELS
+
+
+def load_templates(path):
+    # Load a template set from disk. Supported formats:
+    #   .txt   one template per line
+    #   .json  list of strings or of {"text", "role", "label"} objects
+    #   .jsonl one string or {"text", "role", "label"} object per line
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            items = [line.strip() for line in f if line.strip()]
+
+    templates = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"text": item}
+        templates.append({
+            "text": item["text"],
+            "role": item.get("role") or item["text"],
+            "label": item.get("label"),
+        })
+    return templates
+
+
+class TemplateIndex:
+    # Normalized template embeddings stored as one contiguous float32 matrix,
+    # so a query is a single matrix-vector product.
+    def __init__(self, templates, embeddings):
+        self.templates = templates
+        self.embeddings = embeddings
+        self._ann = None
+        if len(templates) >= config.SIMILARITY_ANN_THRESHOLD:
+            self._ann = _build_ann(embeddings)
+
+    def __len__(self):
+        return len(self.templates)
+
+    def search(self, query_emb, k):
+        k = min(k, len(self.templates))
+        if k <= 0:
+            return []
+        query_emb = np.asarray(query_emb, dtype=np.float32).reshape(-1)
+        if self._ann is not None:
+            scores, idx = self._ann.search(query_emb[None, :], k)
+            pairs = zip(idx[0].tolist(), scores[0].tolist())
+        else:
+            sims = self.embeddings @ query_emb
+            if k < len(sims):
+                idx = np.argpartition(-sims, k - 1)[:k]
+            else:
+                idx = np.arange(len(sims))
+            idx = idx[np.argsort(-sims[idx])]
+            pairs = zip(idx.tolist(), sims[idx].tolist())
+        return [(self.templates[i], float(s)) for i, s in pairs if i >= 0]
+
+
+def _build_ann(embeddings):
+    # Approximate index for very large template sets; faiss is optional
+    try:
+        import faiss
+    except ImportError:
+        return None
+    index = faiss.IndexHNSWFlat(embeddings.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+    return index
+
+
+def _index_version(templates):
+    # Changes whenever the model or the template set changes
+    h = hashlib.sha256()
+    h.update(config.SIMILARITY_MODEL.encode("utf-8"))
+    h.update(config.INFERENCE_BACKEND.encode("utf-8"))
+    for template in templates:
+        h.update(b"\0")
+        h.update(template["text"].encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _encode(texts, model=None):
+    with metrics.span("model", model="embedder"):
+        embs = (model or get_model()).encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    return np.ascontiguousarray(embs, dtype=np.float32)
+
+
+def build_index(templates, cache_dir=None):
+    cache_dir = cache_dir or config.CACHE_DIR
+    version = _index_version(templates)
+    emb_path = os.path.join(cache_dir, f"template_index-{version}.npy")
+
+    if os.path.exists(emb_path):
+        embeddings = np.load(emb_path, mmap_mode="r")
+        if embeddings.shape[0] == len(templates):
+            return TemplateIndex(templates, embeddings)
+
+    embeddings = _encode([t["text"] for t in templates])
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Unique temp file so concurrent builders don't write over each other
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".template_index-", suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, embeddings)
+            os.replace(tmp_path, emb_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with open(os.path.join(cache_dir, f"template_index-{version}.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": config.SIMILARITY_MODEL, "version": version, "count": len(templates)}, f)
+    except OSError:
+        # Read-only cache dir: keep the in-memory index
+        pass
+    return TemplateIndex(templates, embeddings)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_template_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            if config.SIMILARITY_TEMPLATES_PATH:
+                # The score measures resemblance to genuine offers: a close
+                # match to a known scam must not lift it above the low-similarity
+                # penalty (or show up as the "matched job role")
+                templates = [t for t in load_templates(config.SIMILARITY_TEMPLATES_PATH)
+                             if not is_scam_template(t)]
+            else:
+                templates = [{"text": t, "role": t, "label": None} for t in job_templates]
+            _index = build_index(templates)
+        return _index
+
+
+def _pool(embs, weights):
+    vector = np.asarray(weights, dtype=np.float32) @ embs
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def embed_message(text):
+    # The message embedding feature, shared by the similarity search and the
+    # learned classifier head. Long messages are embedded chunk by chunk
+    # (MiniLM only reads 256 tokens); "vector" is their token-weighted mean.
+    model = get_model()
+    budget = config.SIMILARITY_CHUNK_TOKENS or max(16, model.max_seq_length - 2)
+    chunks = chunk_text(text, model.tokenizer, budget)
+    metrics.observe("tokens", sum(tokens for _, tokens in chunks), model="embedder")
+    embs = _encode([chunk for chunk, _ in chunks])
+    counts = [tokens for _, tokens in chunks]
+    return {"chunks": embs, "counts": counts, "vector": _pool(embs, chunk_weights(counts, counts, "mean"))}
+
+
+def embed_messages(texts):
+    # Message vectors for many texts, as one (n, dim) matrix
+    return np.stack([embed_message(text)["vector"] for text in texts])
+
+
+def search_embedding(embedding, k):
+    # "max" keeps each template's best chunk score; "mean"/"attention" search
+    # with a weighted average of the chunk embeddings.
+    embs = embedding["chunks"]
+    index = get_template_index()
+    if len(embs) == 1:
+        return index.search(embs[0], k)
+
+    method = config.SIMILARITY_CHUNK_AGGREGATION
+    if method == "max":
+        best = {}
+        for emb in embs:
+            for template, score in index.search(emb, k):
+                key = id(template)
+                if key not in best or score > best[key][1]:
+                    best[key] = (template, score)
+        return sorted(best.values(), key=lambda item: item[1], reverse=True)[:k]
+
+    if method == "attention":
+        # Attend to the chunks that look most like any template
+        top = [index.search(emb, 1) for emb in embs]
+        weights = chunk_weights([t[0][1] if t else 0.0 for t in top], embedding["counts"], "attention")
+        return index.search(_pool(embs, weights), k)
+    return index.search(embedding["vector"], k)
+
 
-    # Find the template(s) with the highest similarity
-    max_sim = similarities.max()
-    matched_roles = [template for template, sim in zip(job_templates, similarities) if sim == max_sim]
+def compute_similarity(text, top_k=None, embedding=None):
+    # Embed input text (unless the caller already has the embedding) and
+    # search the precomputed template index
+    if embedding is None:
+        embedding = embed_message(text)
+    results = search_embedding(embedding, top_k or config.SIMILARITY_TOP_K)
+    if not results:
+        return 0.0, []
 
-    # Always return avg_score and a list
-    return round(avg_score, 2), matched_roles
+    avg_score = float(np.mean([score for _, score in results])) * 100
+    matches = [
+        {
+            "template": template["text"],
+            "role": template["role"],
+            "label": template["label"],
+            "score": round(score * 100, 2),
+        }
+        for template, score in results
+    ]
+    # Always return the average score of the top matches and a list (best match first)
+    return round(avg_score, 2), matches
@@ -0,0 +1,36 @@
+# spacy_pipeline.py
+
+# One shared spaCy pipeline for ner.py and entity_analysis.py. The model is
+# loaded on first use with the components we don't need excluded, and callers
+# parse each message once and pass the Doc around.
+import config
+import metrics
+import model_registry
+
+
+def _load_nlp():
+    import spacy
+
+    return spacy.load(config.SPACY_MODEL, exclude=config.SPACY_EXCLUDE)
+
+
+model_registry.register("spacy", _load_nlp, warmup=lambda nlp: nlp("Warmup message from Acme Corp."))
+
+
+def get_nlp():
+    return model_registry.get("spacy")
+
+
+def parse(text):
+    nlp = get_nlp()
+    with metrics.span("model", model="spacy"):
+        return nlp(text)
+
+
+def parse_many(texts, n_process=None, batch_size=None):
+    # Lazily yields one Doc per text, in order
+    return get_nlp().pipe(
+        texts,
+        n_process=n_process or config.SPACY_N_PROCESS,
+        batch_size=batch_size or config.SPACY_BATCH_SIZE,
+    )
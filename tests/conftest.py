@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Keep the tests' caches (domain index, WHOIS, template index, ...) out of ~/.cache.
+# Must run before config is imported.
+os.environ.setdefault("SCAM_CACHE_DIR", tempfile.mkdtemp(prefix="scam-detector-tests-"))
+os.environ.setdefault("SCAM_METRICS_SINK", "")
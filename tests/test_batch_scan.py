@@ -0,0 +1,71 @@
+import json
+
+import batch_scan
+
+
+def _write_jsonl(path, lines):
+    path.write_bytes(b"\n".join(lines) + b"\n")
+
+
+def test_jsonl_reader_yields_errors_in_place(tmp_path):
+    path = tmp_path / "in.jsonl"
+    _write_jsonl(path, [
+        json.dumps({"id": "a", "text": "first"}).encode(),
+        b"{not json",
+        json.dumps({"id": "c"}).encode(),
+        b"\xff\xfe broken utf-8",
+        json.dumps(["not", "an", "object"]).encode(),
+        b"",
+        json.dumps({"id": "f", "text": "last"}).encode(),
+    ])
+    items = list(batch_scan.iter_jsonl(str(path)))
+    assert [message_id for message_id, _ in items] == ["a", "2", "c", "4", "5", "f"]
+    assert [isinstance(text, Exception) for _, text in items] == [False, True, True, True, True, False]
+    # Skipping counts the unreadable records too
+    assert list(batch_scan.iter_jsonl(str(path), skip=5)) == [("f", "last")]
+
+
+def _fake_analyze(item):
+    message_id, text = item
+    if text == "boom":
+        raise ValueError("boom")
+    cascade = {"skipped": ["grammar"] if text == "short" else [], "audited": False, "agreed": True}
+    return {"id": message_id, "score": 0, "verdict": "Likely Legitimate", "reasons": [],
+            "cache_hit": False, "degraded": [], "features": {}, "cascade": cascade}
+
+
+def test_scan_writes_error_records_and_resumes_past_them(tmp_path, monkeypatch):
+    # Worker processes are forked, so they see the patched functions
+    monkeypatch.setattr(batch_scan, "analyze_message", _fake_analyze)
+    monkeypatch.setattr(batch_scan, "_init_worker", lambda *args: None)
+    path = tmp_path / "in.jsonl"
+    _write_jsonl(path, [
+        json.dumps({"id": "1", "text": "ok"}).encode(),
+        b"{broken",
+        json.dumps({"id": "3", "text": "boom"}).encode(),
+        json.dumps({"id": "4", "text": "ok"}).encode(),
+    ])
+    out = tmp_path / "out.jsonl"
+    assert batch_scan.scan(str(path), str(out), workers=1) == 4
+    records = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [(r["id"], r["verdict"]) for r in records] == [
+        ("1", "Likely Legitimate"), ("2", "Error"), ("3", "Error"), ("4", "Likely Legitimate"),
+    ]
+    assert records[1]["reasons"][0].startswith("JSONDecodeError")
+
+    with open(path, "ab") as f:
+        f.write(json.dumps({"id": "5", "text": "ok"}).encode() + b"\n")
+    assert batch_scan.scan(str(path), str(out), workers=1, resume=True) == 5
+    assert [json.loads(line)["id"] for line in out.read_text(encoding="utf-8").splitlines()] == ["1", "2", "3", "4", "5"]
+
+
+def test_scan_reports_worker_cascade_stats(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(batch_scan, "analyze_message", _fake_analyze)
+    monkeypatch.setattr(batch_scan, "_init_worker", lambda *args: None)
+    path = tmp_path / "in.jsonl"
+    _write_jsonl(path, [json.dumps({"id": str(i), "text": text}).encode()
+                        for i, text in enumerate(["short", "ok", "short", "boom"])])
+    batch_scan.scan(str(path), str(tmp_path / "out.csv"), workers=2)
+    err = capsys.readouterr().err
+    assert "Cascade: 2/3 message(s) exited early" in err
+    assert "skipped: grammar 2" in err
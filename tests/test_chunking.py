@@ -0,0 +1,52 @@
+import config
+from chunking import chunk_text, prefilter, split_sentences
+
+
+class WordTokenizer:
+    # One token per whitespace-separated word
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [text.split() for text in texts]}
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+
+BODY = "Hi Sam,\nThanks for applying. We'd like to schedule an interview next week.\n"
+
+
+def test_prefilter_drops_short_footers():
+    text = BODY + "--\nSam Lee\nRecruiter, Acme Corp\n"
+    assert prefilter(text) == BODY.strip()
+    text = BODY + "This message is confidential and intended solely for the addressee.\n"
+    assert prefilter(text) == BODY.strip()
+    text = BODY + "On Mon, 3 Jun 2024 Sam wrote:\n> Is the role still open?\n"
+    assert prefilter(text) == BODY.strip()
+
+
+def test_prefilter_keeps_payload_below_a_footer():
+    payload = "To start, buy a $500 gift card and send the code to http://pay-now.example"
+    for footer in ("--", "This message is confidential and intended solely for the addressee."):
+        text = BODY + footer + "\n" + payload
+        assert payload in prefilter(text)
+    # A long "footer" is part of the message
+    text = BODY + "--\n" + "\n".join(f"line {i}" for i in range(30))
+    assert "line 29" in prefilter(text)
+
+
+def test_chunk_text_passes_short_text_through(monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_PREFILTER", 0)
+    text = "Mail john.doe@gmail.com\nor visit www.acme.com for version 3.5!"
+    assert chunk_text(text, WordTokenizer(), 50) == [(text, 8)]
+
+
+def test_chunk_text_splits_long_text_on_sentence_ends(monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_PREFILTER", 0)
+    text = "Mail john.doe@gmail.com today. Pay 3.5 now! Then wait? " + "word " * 7
+    assert split_sentences(text) == ["Mail john.doe@gmail.com today.", "Pay 3.5 now!", "Then wait?", ("word " * 7).strip()]
+    chunks = chunk_text(text, WordTokenizer(), 6)
+    assert chunks == [
+        ("Mail john.doe@gmail.com today. Pay 3.5 now!", 6),
+        ("Then wait?", 2),
+        (" ".join(["word"] * 6), 6),
+        ("word", 1),
+    ]
@@ -0,0 +1,29 @@
+import logging
+import socket
+
+import config
+import metrics
+
+
+def test_configure_survives_a_taken_port(monkeypatch, caplog):
+    taken = socket.socket()
+    taken.bind(("127.0.0.1", 0))
+    taken.listen()
+    monkeypatch.setattr(config, "METRICS_SINK", "prometheus")
+    monkeypatch.setattr(metrics, "_http_server", None)
+    with caplog.at_level(logging.WARNING, logger="scam_detector.metrics"):
+        metrics.configure(port=taken.getsockname()[1])
+    taken.close()
+    assert metrics._http_server is None
+    assert "metrics endpoint not started" in caplog.text
+
+
+def test_log_sink_prints(monkeypatch, capsys):
+    monkeypatch.setattr(config, "METRICS_SINK", "log")
+    monkeypatch.setattr(metrics, "_sinks", [])
+    monkeypatch.setattr(metrics.logger, "handlers", [])
+    monkeypatch.setattr(metrics.logger, "propagate", True)
+    monkeypatch.setattr(metrics.logger, "level", logging.NOTSET)
+    metrics.configure()
+    metrics.incr("test_events_total", kind="demo")
+    assert "test_events_total=1" in capsys.readouterr().err
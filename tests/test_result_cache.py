@@ -0,0 +1,98 @@
+import config
+from result_cache import ResultCache, fingerprint, normalize, resemblance, sketch
+
+TEMPLATE = (
+    "Dear {name}, congratulations! You have been selected for the remote data entry "
+    "position at Global Staffing Solutions. Your starting salary is ${amount} per week. "
+    "To complete onboarding, please reply to {email} with your full name, home address "
+    "and phone number, and review the attached handbook at {url} before Monday. "
+    "We look forward to working with you and wish you every success in your new role."
+)
+
+OUTPUTS = {"classifier": {"label": "scam", "confidence": 0.91}, "grammar": {"score": 88.0, "issues": []},
+           "similarity": {"score": 74.5}, "rules": {"flags": ["Urgency"]}}
+
+
+def _message(name="John", amount="450", email="hr@staffing.com", url="https://t.co/abc"):
+    return TEMPLATE.format(name=name, amount=amount, email=email, url=url)
+
+
+def test_normalize_masks_volatile_parts():
+    assert normalize("Pay $1,200 to Jo@X.com via https://x.io/a?b=1  NOW") == "pay $ <num> to <email> via <url> now"
+    assert fingerprint(_message(amount="450", url="https://t.co/abc"))[0] == \
+        fingerprint(_message(amount="975", url="https://bit.ly/zz9"))[0]
+
+
+def test_exact_hit_only_keeps_model_outputs():
+    cache = ResultCache(max_entries=10)
+    cache.store(_message(), OUTPUTS)
+    outputs, kind = cache.lookup(_message(amount="1,000", email="jobs@other.org"))
+    assert kind == "exact"
+    assert set(outputs) == {"classifier", "grammar", "similarity"}
+
+
+def test_near_duplicate_hit():
+    cache = ResultCache(max_entries=10)
+    cache.store(_message(), OUTPUTS)
+    outputs, kind = cache.lookup(_message(name="Priya"))
+    assert kind == "near"
+    assert outputs["classifier"] == OUTPUTS["classifier"]
+
+
+def test_unrelated_message_misses():
+    cache = ResultCache(max_entries=10)
+    cache.store(_message(), OUTPUTS)
+    other = ("Hi team, the quarterly planning meeting moved to Thursday at 3pm in room B. "
+             "Please bring your roadmap drafts and the budget spreadsheet.")
+    assert cache.lookup(other) == (None, None)
+    assert cache.stats()["misses"] == 1
+
+
+def test_distance_zero_disables_near_hits():
+    cache = ResultCache(max_entries=10, max_distance=0)
+    cache.store(_message(), OUTPUTS)
+    assert cache.lookup(_message(name="Priya")) == (None, None)
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_entries=1, max_distance=0)
+    cache.store("first message about a job", OUTPUTS)
+    cache.store("a completely different second message", OUTPUTS)
+    assert cache.lookup("first message about a job") == (None, None)
+    assert cache.lookup("a completely different second message")[1] == "exact"
+    assert cache.stats()["entries"] == 1
+
+
+def test_persisted_entries_survive_reload(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    cache = ResultCache(max_entries=10, path=path)
+    cache.store(_message(), OUTPUTS)
+    cache.close()
+    reloaded = ResultCache(max_entries=10, path=path)
+    assert reloaded.lookup(_message())[1] == "exact"
+    assert reloaded.lookup(_message(name="Priya"))[1] == "near"
+
+
+def test_appended_payload_is_not_a_near_hit():
+    # A few added sentences barely move the SimHash of a long message
+    cache = ResultCache(max_entries=10)
+    cache.store(_message(), OUTPUTS)
+    tampered = _message() + " Please purchase a gift card and send your bank account details."
+    assert cache.lookup(tampered) == (None, None)
+    assert cache.stats()["near_rejected"] == 1
+
+
+def test_resemblance():
+    a = sketch(normalize(_message()))
+    assert resemblance(a, a) == 1.0
+    assert resemblance(a, sketch(normalize(_message(name="Priya")))) > 0.85
+    assert resemblance(a, sketch(normalize("something else entirely"))) == 0.0
+
+
+def test_persisted_entries_are_per_model_config(tmp_path, monkeypatch):
+    path = str(tmp_path / "results.sqlite")
+    cache = ResultCache(max_entries=10, path=path)
+    cache.store(_message(), OUTPUTS)
+    cache.close()
+    monkeypatch.setattr(config, "INFERENCE_BACKEND", "int8")
+    assert ResultCache(max_entries=10, path=path).lookup(_message()) == (None, None)
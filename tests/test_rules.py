@@ -0,0 +1,126 @@
+import random
+import re
+
+from rules import RuleEngine, evaluate_text, highlight_text, scan_text, triggered_rules
+
+# The patterns rules.py checked one by one with re.search before the rule engine
+BASELINE_RULES = {
+    "Urgency": r"urgent|immediately|asap|24 hours|limited time",
+    "Request for Sensitive Info": r"bank account|passport|driver'?s license|id card|social security",
+    "Unusual Payment": r"bitcoin|gift card|crypto|western union|moneygram",
+    "Unprofessional Email": r"@gmail\.com|@yahoo\.com|@hotmail\.com",
+    "Upfront Payment Promise": r"initial payment|payment upfront|advance payment",
+}
+
+FRAGMENTS = [
+    "URGENT", "reply immediately", "ASAP", "within 24 hours", "limited time offer",
+    "your bank account", "a copy of your passport", "driver's license", "drivers license",
+    "ID card", "social security number", "Bitcoin", "gift card", "crypto wallet",
+    "Western Union", "MoneyGram", "initial payment", "payment upfront", "advance payment",
+    "hr@gmail.com", "Jobs@Yahoo.com", "recruiter@hotmail.com", "careers@acme.com",
+    "asap@gmail.com", "jobs@cryptopay.io", "urgent.hire@yahoo.com",
+    "https://acme.com/jobs", "Dear candidate,", "the interview", "we are pleased", "thank you.",
+]
+
+
+def baseline_flags(text):
+    return [name for name, pattern in BASELINE_RULES.items() if re.search(pattern, text, re.IGNORECASE)]
+
+
+def test_matches_baseline_on_examples():
+    texts = [
+        "",
+        "Dear candidate, thank you for applying. We will be in touch next week.",
+        "URGENT: send your bank account details immediately.",
+        "Pay the initial payment in Bitcoin or with a gift card.",
+        "Contact our HR at hr.dept@gmail.com with your passport.",
+        "Payment upfront via Western Union, limited time only.",
+        "Email careers@acme.com about the role.",
+    ]
+    for text in texts:
+        assert evaluate_text(text)[1] == baseline_flags(text), text
+
+
+def test_matches_baseline_on_random_messages():
+    rng = random.Random(7)
+    for _ in range(2000):
+        text = " ".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 8)))
+        assert evaluate_text(text)[1] == baseline_flags(text), text
+
+
+def test_score_is_capped():
+    score, flags = evaluate_text(" ".join(FRAGMENTS))
+    assert flags == list(BASELINE_RULES)
+    assert score == min(100, 15 * len(flags))
+
+
+def test_matches_and_highlight():
+    text = "Act <now>: urgent Bitcoin transfer"
+    matches = scan_text(text)
+    assert [(m["rule_id"], text[m["start"]:m["end"]]) for m in matches] == [
+        ("urgency", "urgent"),
+        ("unusual_payment", "Bitcoin"),
+    ]
+    assert [rule["name"] for rule in triggered_rules(matches)] == ["Urgency", "Unusual Payment"]
+    assert highlight_text(text, matches) == (
+        "Act &lt;now&gt;: <span class='red-highlight'>urgent</span> "
+        "<span class='red-highlight'>Bitcoin</span> transfer"
+    )
+
+
+def test_address_does_not_hide_pattern_matches():
+    assert evaluate_text("Contact asap@gmail.com now")[1] == ["Urgency", "Unprofessional Email"]
+    assert evaluate_text("Reach jobs@cryptopay.io")[1] == ["Unusual Payment"]
+    for text in ("Contact asap@gmail.com now", "Reach jobs@cryptopay.io", "urgent.hire@yahoo.com"):
+        assert evaluate_text(text)[1] == baseline_flags(text), text
+
+
+def test_free_mail_match_starts_at_the_at_sign():
+    text = "Contact asap@gmail.com now"
+    matches = scan_text(text)
+    assert [(m["rule_id"], text[m["start"]:m["end"]]) for m in matches] == [
+        ("urgency", "asap"),
+        ("unprofessional_email", "@gmail.com"),
+    ]
+    assert highlight_text(text, matches) == (
+        "Contact <span class='red-highlight'>asap</span>"
+        "<span class='red-highlight'>@gmail.com</span> now"
+    )
+
+
+def test_overlapping_matches_are_highlighted_once():
+    text = "pay advance payment upfront"
+    matches = [{"start": 4, "end": 19}, {"start": 12, "end": 27}]
+    assert highlight_text(text, matches) == (
+        "pay <span class='red-highlight'>advance payment</span>"
+        "<span class='red-highlight'> upfront</span>"
+    )
+
+
+def test_incremental_rules_match_whole_message_scan():
+    from extraction import extract
+    from incremental import StageMemo, incremental_stages
+    from pipeline import run_rules
+
+    text = ("Dear candidate,\n\nWrite to asap@gmail.com for the interview.\n\n"
+            "Send the initial payment in crypto to jobs@cryptopay.io within 24 hours.")
+    outputs = {"extraction": extract(text)}
+    rules_stage = next(stage for stage in incremental_stages(StageMemo(), {}) if stage.name == "rules")
+    assert rules_stage.func(text, outputs) == run_rules(text, outputs)
+
+
+def test_overlapping_rules_all_fire():
+    patterns = {"a": "gift card", "b": "card number", "c": "wire", "d": "wire transfer", "e": "number by"}
+    engine = RuleEngine([{"id": i, "name": i, "pattern": p, "weight": 15} for i, p in patterns.items()])
+    text = "send the gift card number by wire transfer"
+    matches = engine.scan(text)
+    assert sorted({m["rule_id"] for m in matches}) == ["a", "b", "c", "d", "e"]
+    assert [m["start"] for m in matches] == sorted(m["start"] for m in matches)
+    assert [text[m["start"]:m["end"]] for m in matches if m["rule_id"] in ("b", "d")] == ["card number", "wire transfer"]
+
+    rng = random.Random(3)
+    words = ["gift", "card", "number", "by", "wire", "transfer", "now"]
+    for _ in range(500):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 10)))
+        expected = [i for i, p in patterns.items() if re.search(p, text, re.IGNORECASE)]
+        assert sorted({m["rule_id"] for m in engine.scan(text)}) == expected, text
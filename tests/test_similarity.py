@@ -0,0 +1,22 @@
+import json
+
+import numpy as np
+
+import config
+import similarity
+
+
+def test_scam_templates_are_left_out_of_the_score(tmp_path, monkeypatch):
+    path = tmp_path / "templates.jsonl"
+    path.write_text("\n".join(json.dumps(item) for item in [
+        {"text": "We are hiring a data analyst.", "role": "Data Analyst", "label": "legit"},
+        {"text": "Buy a gift card to start work.", "role": "Gift card scam", "label": "scam"},
+        {"text": "Remote support role, apply today.", "role": "Support"},
+        {"text": "Send your bank details.", "role": "Phishing", "label": "Phishing/Scam Email"},
+    ]), encoding="utf-8")
+    monkeypatch.setattr(config, "SIMILARITY_TEMPLATES_PATH", str(path))
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(similarity, "_index", None)
+    monkeypatch.setattr(similarity, "_encode", lambda texts, model=None: np.eye(len(texts), 4, dtype=np.float32))
+    index = similarity.get_template_index()
+    assert [t["role"] for t in index.templates] == ["Data Analyst", "Support"]
@@ -0,0 +1,109 @@
+import math
+import random
+
+import numpy as np
+
+from verdict import SCAM_LABEL, ScoringModel, feature_matrix, features_from_outputs, rescore_records, score_batch
+
+
+def old_app_score(flags, email_warnings, link_warnings, mismatch_warnings, scam_confidence,
+                  grammar_score, similarity_score):
+    # The scoring that used to live in app.py
+    score = 0
+    score += min(15, 5 * flags)
+    score += min(10, 5 * email_warnings)
+    score += min(10, 5 * link_warnings)
+    if mismatch_warnings:
+        score += 5
+    score += int(scam_confidence * 60)
+    if grammar_score is not None and grammar_score < 60:
+        score += 5
+    if similarity_score is not None and similarity_score < 20:
+        score += 10
+    score = min(100, max(0, score))
+    if score >= 60:
+        verdict = "Likely Scam"
+    elif score >= 40:
+        verdict = "Suspicious"
+    else:
+        verdict = "Likely Legitimate"
+    return score, verdict
+
+
+def _random_features(rng):
+    return {
+        "flags": rng.randint(0, 5),
+        "email_warnings": rng.randint(0, 4),
+        "link_warnings": rng.randint(0, 4),
+        "mismatch_warnings": rng.randint(0, 3),
+        # Include values right at the int() truncation edges
+        "scam_confidence": rng.choice([rng.random(), rng.randint(0, 60) / 60, 0.0, 1.0]),
+        "grammar_score": rng.choice([None, 59.99, 60, rng.uniform(0, 100)]),
+        "similarity_score": rng.choice([None, 19.99, 20, rng.uniform(0, 100)]),
+    }
+
+
+def test_default_weights_match_old_app_formula():
+    rng = random.Random(0)
+    records = [_random_features(rng) for _ in range(5000)]
+    scores, verdicts = score_batch(feature_matrix(records), model=ScoringModel.load())
+    for record, score, verdict in zip(records, scores.tolist(), verdicts.tolist()):
+        assert (score, verdict) == old_app_score(**record), record
+
+
+def test_scores_from_stage_outputs():
+    outputs = {
+        "rules": {"flags": ["Urgency", "Unusual Payment"]},
+        "links": {"email_warnings": ["x"], "link_warnings": []},
+        "mismatch": {"warnings": ["y"]},
+        "classifier": {"scores": {SCAM_LABEL: 0.5}},
+        "grammar": {"score": 42.0},
+        "similarity": None,
+    }
+    features = features_from_outputs(outputs)
+    assert math.isnan(features[-1])
+    scores, verdicts = score_batch(features.reshape(1, -1), model=ScoringModel.load())
+    assert scores.tolist() == [10 + 5 + 5 + 30 + 5]
+    assert verdicts.tolist() == ["Suspicious"]
+
+
+def test_empty_batch():
+    scores, verdicts = score_batch(np.empty((0, 7)), model=ScoringModel.load())
+    assert len(scores) == 0 and len(verdicts) == 0
+
+
+def test_rescore_flags_rows_the_skipped_stages_could_change():
+    model = ScoringModel({
+        "features": {
+            "flags": {"weight": 20, "max_units": 3},
+            "email_warnings": {"weight": 0},
+            "link_warnings": {"weight": 0},
+            "mismatch_warnings": {"weight": 0},
+            "scam_confidence": {"weight": 0},
+            "grammar_score": {"weight": 10, "below": 60},
+            "similarity_score": {"weight": 30, "below": 20},
+        },
+        "thresholds": {"suspicious": 40, "scam": 60},
+    })
+    features = {"flags": 2, "email_warnings": 0, "link_warnings": 0, "mismatch_warnings": 0,
+                "scam_confidence": 0.0, "grammar_score": None, "similarity_score": None}
+    records = [
+        # Grammar can add 10 at most: 40 -> 50 stays Suspicious
+        {"id": "a", "verdict": "Suspicious", "features": features,
+         "cascade": {"skipped": ["grammar"], "audited": False, "agreed": True}},
+        # Similarity can add 30: 40 -> 70 would be Likely Scam
+        {"id": "b", "verdict": "Suspicious", "features": features,
+         "cascade": {"skipped": ["grammar", "similarity"], "audited": False, "agreed": True}},
+        # Audited, so every stage was measured
+        {"id": "c", "verdict": "Suspicious", "features": features,
+         "cascade": {"skipped": ["similarity"], "audited": True, "agreed": True}},
+        {"id": "d", "verdict": "Error", "features": None},
+    ]
+    out, changed, unreliable = rescore_records(records, model)
+    assert [(r["id"], r.get("score"), r["verdict"], r.get("unreliable", False)) for r in out] == [
+        ("a", 40, "Suspicious", False),
+        ("b", 40, "Suspicious", True),
+        ("c", 40, "Suspicious", False),
+        ("d", None, "Error", False),
+    ]
+    assert (changed, unreliable) == (0, 1)
@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from whois_cache import DomainAgeCache, DomainAgeResolver, make_static_lookup
+
+
+def _resolver(lookup, **kwargs):
+    return DomainAgeResolver(lookup=lookup, cache=DomainAgeCache(), **kwargs)
+
+
+def _hanging_lookup(release, ages):
+    def lookup(domain):
+        if domain.startswith("hang"):
+            release.wait(10)
+        return ages.get(domain)
+    return lookup
+
+
+def test_resolve_many_caches_results():
+    calls = []
+
+    def lookup(domain):
+        calls.append(domain)
+        return {"acme.com": 12}.get(domain)
+
+    resolver = _resolver(lookup)
+    assert resolver.resolve_many(["acme.com", "ACME.com", "new.io"]) == {"acme.com": 12, "new.io": None}
+    assert resolver.resolve("acme.com") == 12
+    assert sorted(calls) == ["acme.com", "new.io"]
+
+
+def test_submit_when_lookup_already_finished():
+    # The done callback runs inline for a finished future; submit used to
+    # hold its lock while registering it and deadlocked
+    resolver = _resolver(make_static_lookup({"acme.com": 3}))
+
+    def submit_finished(fn, domain):
+        future = Future()
+        future.set_result(resolver.lookup(domain))
+        return future
+
+    resolver._executor.submit = submit_finished
+    result = []
+    thread = threading.Thread(target=lambda: result.append(resolver.submit("acme.com").result()), daemon=True)
+    thread.start()
+    thread.join(2)
+    assert result == [3]
+    assert resolver.inflight() == (0, 0)
+    # And again for the now cached domain
+    assert resolver.resolve("acme.com") == 3
+
+
+def test_each_lookup_gets_its_own_timeout():
+    # One worker: b.com only starts once a.com is done, so a single shared
+    # deadline for the batch would have given up on it
+    resolver = _resolver(make_static_lookup({"a.com": 1, "b.com": 2}, delay=0.15),
+                         max_concurrency=1, timeout=0.25)
+    assert resolver.resolve_many(["a.com", "b.com"]) == {"a.com": 1, "b.com": 2}
+
+
+def test_hung_lookup_times_out():
+    release = threading.Event()
+    resolver = _resolver(_hanging_lookup(release, {"hang.com": 5}), max_concurrency=1, timeout=0.1)
+    try:
+        started = time.monotonic()
+        assert resolver.resolve("hang.com") is None
+        assert time.monotonic() - started < 1
+        assert resolver.inflight() == (1, 1)
+    finally:
+        release.set()
+
+
+def test_lookups_past_the_inflight_cap_are_shed():
+    release = threading.Event()
+    resolver = _resolver(_hanging_lookup(release, {"ok.com": 7}), max_concurrency=1, timeout=0.1, max_inflight=1)
+    try:
+        resolver.submit("hang.com")
+        started = time.monotonic()
+        assert resolver.resolve("ok.com") is None
+        assert time.monotonic() - started < 0.1
+    finally:
+        release.set()
+    resolver.submit("hang.com").result(2)
+    # The shed domain wasn't cached as unknown and resolves once there is room
+    assert resolver.resolve("ok.com") == 7
@@ -1,27 +1,350 @@
-def get_final_score(
-    rule_score,
-    nlp_score,
-    grammar_score,
-    domain_flags,
-    entity_flags
-):
-    # Normalize counts to scale of 0-100 (assume max 5 flags for scaling)
-    domain_score = min(len(domain_flags) * 20, 100)
-    entity_score = min(len(entity_flags) * 20, 100)
-
-    final = (
-        0.30 * rule_score +
-        0.35 * nlp_score +
-        0.15 * domain_score +
-        0.10 * entity_score +
-        0.10 * grammar_score
-    )
-
-    if final >= 80:
-        verdict = "❌ Scam"
-    elif final >= 50:
-        verdict = "⚠️ Suspicious"
+# verdict.py
+
+# Final scoring for the analysis pipeline. Each message is reduced to a small
+# feature vector (flag/warning counts, the classifier's scam probability, the
+# grammar and similarity scores), and scores and verdicts are computed for a
+# whole (n, features) NumPy array in one call. Weights and thresholds come
+# from data/scoring.json; `calibrate` refits them to a labelled set, and
+# `rescore` re-scores saved batch_scan output without running any model.
+#
+#   python verdict.py features --data labelled.jsonl --out features.jsonl
+#   python verdict.py calibrate --features features.jsonl --out data/scoring.json
+#   python verdict.py rescore verdicts.jsonl -o rescored.jsonl
+import argparse
+import json
+import sys
+import threading
+
+import numpy as np
+
+import config
+
+SCAM_LABEL = "Phishing/Scam Email"
+
+# Feature vector layout, and the stage each feature comes from
+FEATURES = [
+    "flags",              # red-flag rules triggered
+    "email_warnings",     # suspicious sender addresses
+    "link_warnings",      # suspicious links
+    "mismatch_warnings",  # organizations that don't match the sender's domain
+    "scam_confidence",    # classifier probability of SCAM_LABEL
+    "grammar_score",      # 0-100, NaN when the stage didn't run
+    "similarity_score",   # 0-100, NaN when the stage didn't run
+]
+FEATURE_STAGES = {
+    "flags": "rules",
+    "email_warnings": "links",
+    "link_warnings": "links",
+    "mismatch_warnings": "mismatch",
+    "scam_confidence": "classifier",
+    "grammar_score": "grammar",
+    "similarity_score": "similarity",
+}
+
+VERDICTS = ["Likely Legitimate", "Suspicious", "Likely Scam"]
+
+
+def features_from_outputs(outputs):
+    # One message's stage outputs -> feature vector. Degraded or skipped
+    # stages count as "nothing found".
+    rules = outputs.get("rules") or {}
+    links = outputs.get("links") or {}
+    mismatch = outputs.get("mismatch") or {}
+    classifier = outputs.get("classifier") or {}
+    grammar = outputs.get("grammar")
+    similarity = outputs.get("similarity")
+    return np.array([
+        len(rules.get("flags", [])),
+        len(links.get("email_warnings", [])),
+        len(links.get("link_warnings", [])),
+        len(mismatch.get("warnings", [])),
+        (classifier.get("scores") or {}).get(SCAM_LABEL, 0.0),
+        grammar["score"] if grammar is not None else np.nan,
+        similarity["score"] if similarity is not None else np.nan,
+    ], dtype=np.float64)
+
+
+def feature_matrix(records):
+    # [{"feature": value}] (as stored by batch_scan; None = missing) -> (n, features) array
+    return np.array(
+        [[np.nan if record.get(name) is None else record[name] for name in FEATURES] for record in records],
+        dtype=np.float64,
+    ).reshape(-1, len(FEATURES))
+
+
+def features_to_dict(vector):
+    return {name: None if np.isnan(value) else float(value) for name, value in zip(FEATURES, vector)}
+
+
+class ScoringModel:
+    # score = sum over features of weight * min(units, max_units), floored and
+    # clipped to 0-100. For count/probability features the units are the raw
+    # value; a feature with a "below" threshold counts 1 unit when its value
+    # is under it (low grammar or similarity scores).
+    def __init__(self, spec):
+        features = spec["features"]
+        self.weights = np.array([features[name]["weight"] for name in FEATURES], dtype=np.float64)
+        self.max_units = np.array([features[name].get("max_units", 1) for name in FEATURES], dtype=np.float64)
+        self.below = np.array([features[name].get("below", np.nan) for name in FEATURES], dtype=np.float64)
+        self.suspicious_threshold = spec["thresholds"]["suspicious"]
+        self.scam_threshold = spec["thresholds"]["scam"]
+        self.meta = spec.get("meta", {})
+
+    @classmethod
+    def load(cls, path=None):
+        with open(path or config.SCORING_PATH, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def to_dict(self):
+        features = {}
+        for i, name in enumerate(FEATURES):
+            entry = {"weight": round(float(self.weights[i]), 4)}
+            if np.isnan(self.below[i]):
+                entry["max_units"] = float(self.max_units[i]) if self.max_units[i] % 1 else int(self.max_units[i])
+            else:
+                entry["below"] = float(self.below[i]) if self.below[i] % 1 else int(self.below[i])
+            features[name] = entry
+        spec = {
+            "features": features,
+            "thresholds": {"suspicious": self.suspicious_threshold, "scam": self.scam_threshold},
+        }
+        if self.meta:
+            spec["meta"] = self.meta
+        return spec
+
+    def units(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+        indicator = ~np.isnan(self.below)
+        with np.errstate(invalid="ignore"):
+            # NaN < threshold is False, so a missing score adds nothing
+            units = np.where(indicator, X < self.below, X)
+        return np.minimum(np.nan_to_num(units, nan=0.0), self.max_units)
+
+    def scores(self, X, extra=0.0):
+        # extra: points added before flooring (the cascade's upper bound)
+        raw = self.units(X) @ self.weights + extra
+        # The small epsilon keeps e.g. 0.7 * 60 from flooring to 41
+        return np.clip(np.floor(raw + 1e-9), 0, 100).astype(np.int64)
+
+    def verdicts(self, scores):
+        scores = np.asarray(scores)
+        index = (scores >= self.suspicious_threshold).astype(np.int64) + (scores >= self.scam_threshold)
+        return np.array(VERDICTS, dtype=object)[index]
+
+    def verdict_for(self, score):
+        return self.verdicts(np.array([score]))[0]
+
+    def stage_max_contribution(self):
+        # Most each stage can add to a score; the cascade uses these to tell
+        # when the stages still to run can no longer change the verdict
+        contribution = {}
+        for name, weight, max_units in zip(FEATURES, self.weights, self.max_units):
+            stage = FEATURE_STAGES[name]
+            contribution[stage] = contribution.get(stage, 0.0) + max(0.0, weight) * max_units
+        return contribution
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_scoring_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = ScoringModel.load()
+        return _model
+
+
+def score_batch(X, model=None):
+    # (n, features) array -> (scores, verdicts), both length n
+    model = model or get_scoring_model()
+    scores = model.scores(X)
+    return scores, model.verdicts(scores)
+
+
+def _skipped_stages(record):
+    # Stages the cascade skipped for a batch_scan record; an audited run
+    # measured them anyway
+    cascade = record.get("cascade") or {}
+    return [] if cascade.get("audited") else cascade.get("skipped", [])
+
+
+def rescore_records(records, model=None):
+    # Re-scores batch_scan records -> (new records, verdicts changed, unreliable).
+    # Skipped stages count as "nothing found", which was only safe under the
+    # weights the cascade ran with; a row whose verdict the skipped stages
+    # could now change is marked "unreliable" (re-scan it with SCAM_CASCADE_ENABLED=0).
+    model = model or get_scoring_model()
+    # Error records (no features) are copied through unchanged
+    scored = [record for record in records if record.get("features") is not None]
+    X = feature_matrix([record["features"] for record in scored])
+    scores, verdicts = score_batch(X, model)
+    maxima = model.stage_max_contribution()
+    extra = np.array([sum(maxima.get(name, 0.0) for name in _skipped_stages(record)) for record in scored])
+    unsettled = model.verdicts(model.scores(X, extra=extra)) != verdicts
+    rescored = {id(record): (score, verdict, bool(flag))
+                for record, score, verdict, flag in zip(scored, scores.tolist(), verdicts.tolist(), unsettled)}
+    out = []
+    changed = unreliable = 0
+    for record in records:
+        if id(record) in rescored:
+            score, verdict, flag = rescored[id(record)]
+            changed += verdict != record.get("verdict")
+            unreliable += flag
+            record = dict(record, score=score, verdict=verdict)
+            record.pop("unreliable", None)
+            if flag:
+                record["unreliable"] = True
+        out.append(record)
+    return out, changed, unreliable
+
+
+# ---- Calibration ----
+
+def _fit_weights(units, y, max_units, l2=1e-3, steps=3000, lr=0.5):
+    # Logistic regression on the saturated units scaled to [0, 1], with the
+    # weights kept non-negative (projected gradient descent) so every feature
+    # can only push a message towards "scam" and the cascade bounds hold
+    x = units / max_units
+    w = np.zeros(x.shape[1])
+    b = 0.0
+    for _ in range(steps):
+        p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+        grad = p - y
+        w = np.maximum(0.0, w - lr * (x.T @ grad / len(y) + l2 * w))
+        b -= lr * grad.mean()
+    return w
+
+
+def _best_thresholds(scores, y, suspicious_recall):
+    # "scam" threshold: best F1 for scam messages; "suspicious": the highest
+    # threshold at or below it that still catches `suspicious_recall` of them
+    candidates = np.unique(scores)
+    predicted = scores[None, :] >= candidates[:, None]
+    tp = (predicted & (y[None, :] == 1)).sum(axis=1)
+    fp = (predicted & (y[None, :] == 0)).sum(axis=1)
+    positives = max(1, int(y.sum()))
+    recall = tp / positives
+    f1 = 2 * tp / np.maximum(1, 2 * tp + fp + (positives - tp))
+    scam = int(candidates[np.argmax(f1)])
+    ok = (candidates <= scam) & (recall >= suspicious_recall)
+    suspicious = int(candidates[ok].max()) if ok.any() else int(candidates.min())
+    return min(suspicious, scam), scam
+
+
+def evaluate(model, X, y):
+    scores, verdicts = score_batch(X, model)
+    report = {}
+    for name, flagged in (("scam", verdicts == VERDICTS[2]), ("suspicious_or_scam", verdicts != VERDICTS[0])):
+        tp = int((flagged & (y == 1)).sum())
+        report[name] = {
+            "precision": round(tp / max(1, int(flagged.sum())), 4),
+            "recall": round(tp / max(1, int(y.sum())), 4),
+        }
+    report["accuracy"] = round(float(((verdicts == VERDICTS[2]) == (y == 1)).mean()), 4) if len(y) else None
+    return report
+
+
+def calibrate(X, y, base=None, suspicious_recall=0.95):
+    # Refit the weights (keeping each feature's saturation/threshold) and both
+    # thresholds. Weights are scaled so a message maxing out every feature
+    # scores 100, like the hand-tuned defaults are roughly.
+    base = base or get_scoring_model()
+    X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+    y = np.asarray(y, dtype=np.float64)
+    if len(np.unique(y)) < 2:
+        raise ValueError("Calibration needs both scam and non-scam examples")
+    w = _fit_weights(base.units(X), y, base.max_units)
+    if not w.any():
+        raise ValueError("No feature separates the classes; keeping the current weights")
+    spec = base.to_dict()
+    for name, weight, max_units in zip(FEATURES, w * 100.0 / w.sum(), base.max_units):
+        spec["features"][name]["weight"] = round(float(weight / max_units), 4)
+    model = ScoringModel(spec)
+    model.suspicious_threshold, model.scam_threshold = _best_thresholds(model.scores(X), y, suspicious_recall)
+    model.meta = {
+        "calibrated_on": int(len(y)),
+        "scam_examples": int(y.sum()),
+        "suspicious_recall_target": suspicious_recall,
+        "before": evaluate(base, X, y),
+        "after": evaluate(model, X, y),
+    }
+    return model
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def features_for_texts(texts):
+    # Runs the full pipeline (no cascade, so every feature is measured)
+    from pipeline import run_pipeline
+
+    return feature_matrix([run_pipeline(text, cascade=False)["features"] for text in texts])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch scoring, calibration and re-scoring of verdicts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    feat = sub.add_parser("features", help="run the pipeline over a labelled JSONL file and save the features")
+    feat.add_argument("--data", required=True, help='labelled JSONL ({"text": ..., "label": ...})')
+    feat.add_argument("--out", required=True)
+
+    cal = sub.add_parser("calibrate", help="fit weights and thresholds to a labelled set")
+    source = cal.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data", help="labelled JSONL file (runs the pipeline)")
+    source.add_argument("--features", help='JSONL of {"features": {...}, "label": ...} (no models needed)')
+    cal.add_argument("--out", default=config.SCORING_PATH)
+    cal.add_argument("--suspicious-recall", type=float, default=0.95,
+                     help="share of scams the Suspicious threshold must still catch")
+
+    res = sub.add_parser("rescore", help="re-score batch_scan JSONL output with the current weights")
+    res.add_argument("input")
+    res.add_argument("-o", "--output", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "rescore":
+        records, changed, unreliable = rescore_records(_read_jsonl(args.input))
+        with open(args.output, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count = sum(record.get("features") is not None for record in records)
+        print(f"Re-scored {count} message(s), {changed} verdict(s) changed -> {args.output}", file=sys.stderr)
+        if unreliable:
+            print(f"{unreliable} verdict(s) marked unreliable: stages the cascade skipped could change them "
+                  f"under the new weights; re-scan those messages with SCAM_CASCADE_ENABLED=0", file=sys.stderr)
+        return
+
+    from fast_classifier import LABEL_ALIASES
+
+    if args.command == "features" or args.data:
+        from fast_classifier import load_labelled
+
+        texts, labels = load_labelled(args.data)
+        X = features_for_texts(texts)
     else:
-        verdict = "✅ Likely Safe"
+        records = _read_jsonl(args.features)
+        X = feature_matrix([record["features"] for record in records])
+        labels = [LABEL_ALIASES.get(str(record["label"]).lower(), record["label"]) for record in records]
+    y = np.array([label == SCAM_LABEL for label in labels], dtype=np.float64)
+
+    if args.command == "features":
+        with open(args.out, "w", encoding="utf-8") as f:
+            for vector, label in zip(X, labels):
+                f.write(json.dumps({"features": features_to_dict(vector), "label": label}) + "\n")
+        print(f"Saved features for {len(labels)} message(s) to {args.out}", file=sys.stderr)
+        return
+
+    model = calibrate(X, y, suspicious_recall=args.suspicious_recall)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f, indent=2)
+        f.write("\n")
+    json.dump(model.meta, sys.stdout, indent=2)
+    print()
+
 
-    return int(final), verdict
+if __name__ == "__main__":
+    main()
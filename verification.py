@@ -1,23 +1,41 @@
-import re
+from domain_reputation import get_index
+from extraction import email_spans, url_spans
 
 # Example: Check if email domain is from a known free provider
-def check_email_domain(email):
-    free_domains = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "aol.com", "protonmail.com"]
-    match = re.search(r"@([\w\.-]+)", email)
-    if match:
-        domain = match.group(1).lower()
-        if domain in free_domains:
+# `span` is the email's span from extraction.extract when the caller already has it
+def check_email_domain(email, span=None):
+    if span is None:
+        spans = email_spans(email)
+        span = spans[0] if spans else None
+    if span:
+        domain = span["host"]
+        index = get_index()
+        if index.is_scam(domain):
+            return False, f"🚩 Email domain is on the known-scam list: {domain}"
+        if index.is_disposable(domain):
+            return False, f"🚩 Email uses a disposable address provider: {domain}"
+        if index.is_free_mail(domain):
             return False, f"🚩 Email uses free domain: {domain}"
         else:
             return True, f"✅ Email domain looks professional: {domain}"
     return False, "❓ Could not extract domain from email."
 
 # Example: Check if a link is suspicious (very basic)
-def check_link(link):
-    suspicious_keywords = ["bit.ly", "tinyurl", "free", "bonus", "giveaway", "prize"]
-    for kw in suspicious_keywords:
-        if kw in link.lower():
-            return False, f"🚩 Suspicious keyword in link: {kw}"
+def check_link(link, span=None):
+    if span is None:
+        spans = url_spans(link if "://" in link else "http://" + link)
+        span = spans[0] if spans else None
+    host = span["host"] if span else ""
+    index = get_index()
+    if host and index.is_scam(host):
+        return False, f"🚩 Link points to a known scam domain: {host}"
+    if host and index.is_shortener(host):
+        return False, f"🚩 Link uses a URL shortener: {host}"
+    if not (host and index.is_allowed(host)):
+        suspicious_keywords = ["free", "bonus", "giveaway", "prize"]
+        for kw in suspicious_keywords:
+            if kw in link.lower():
+                return False, f"🚩 Suspicious keyword in link: {kw}"
     if link.lower().startswith("http://") or link.lower().startswith("https://"):
         return True, "✅ Link appears to be formatted correctly."
     return False, "❓ Link does not appear valid."
@@ -0,0 +1,222 @@
+# whois_cache.py
+
+# Cached, concurrent domain-age lookups. Results are kept in an in-memory LRU
+# backed by SQLite so they survive restarts, and the actual WHOIS call is
+# pluggable so tests and benchmarks can use a local fake.
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+
+import config
+import metrics
+
+_MISSING = object()
+
+
+def whois_lookup(domain):
+    # Default resolver: domain age in whole years, or None if unknown
+    import whois
+
+    w = whois.whois(domain)
+    created = w.creation_date
+    if isinstance(created, list):
+        created = min((c for c in created if isinstance(c, datetime)), default=None)
+    if not isinstance(created, datetime):
+        return None
+    return max(0, int((datetime.now() - created.replace(tzinfo=None)).days / 365.25))
+
+
+def make_static_lookup(ages, default=None, delay=0.0):
+    # Fake resolver for tests and benchmarks: answers from a dict, optionally
+    # sleeping to simulate network latency
+    def lookup(domain):
+        if delay:
+            time.sleep(delay)
+        return ages.get(domain, default)
+    return lookup
+
+
+class DomainAgeCache:
+    def __init__(self, path=None, max_entries=None, ttl=None, negative_ttl=None):
+        self.max_entries = max_entries or config.WHOIS_CACHE_SIZE
+        self.ttl = config.WHOIS_TTL if ttl is None else ttl
+        self.negative_ttl = config.WHOIS_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self._entries = OrderedDict()  # domain -> (age, expires_at)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS domain_age ("
+                "domain TEXT PRIMARY KEY, age INTEGER, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, domain):
+        # Returns the cached age (which may be None for a cached failure),
+        # or _MISSING when there is no fresh entry
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(domain)
+                    return entry[0]
+                del self._entries[domain]
+            if self._db is None:
+                return _MISSING
+            row = self._db.execute(
+                "SELECT age, expires_at FROM domain_age WHERE domain = ?", (domain,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                return _MISSING
+            self._remember(domain, row[0], row[1])
+            return row[0]
+
+    def set(self, domain, age):
+        expires_at = time.time() + (self.ttl if age is not None else self.negative_ttl)
+        with self._lock:
+            self._remember(domain, age, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO domain_age (domain, age, expires_at) VALUES (?, ?, ?)",
+                    (domain, age, expires_at),
+                )
+                self._db.commit()
+
+    def _remember(self, domain, age, expires_at):
+        self._entries[domain] = (age, expires_at)
+        self._entries.move_to_end(domain)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class DomainAgeResolver:
+    def __init__(self, lookup=None, cache=None, max_concurrency=None, timeout=None, max_inflight=None):
+        self.lookup = lookup or whois_lookup
+        self.cache = cache if cache is not None else DomainAgeCache()
+        self.timeout = config.WHOIS_TIMEOUT if timeout is None else timeout
+        self.max_inflight = max_inflight or config.WHOIS_MAX_INFLIGHT
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency or config.WHOIS_MAX_CONCURRENCY,
+            thread_name_prefix="whois",
+        )
+        self._inflight = {}  # domain -> future, queued or running
+        self._started = {}  # domain -> monotonic time its lookup started running
+        self._lock = threading.Lock()
+
+    def _lookup_and_cache(self, domain):
+        with self._lock:
+            self._started[domain] = time.monotonic()
+        try:
+            with metrics.span("whois_lookup"):
+                age = self.lookup(domain)
+            metrics.incr("whois_lookups_total", result="ok" if age is not None else "unknown")
+        except Exception:
+            age = None
+            metrics.incr("whois_lookups_total", result="failure")
+        self.cache.set(domain, age)
+        return age
+
+    def _done(self, domain, future):
+        with self._lock:
+            if self._inflight.get(domain) is future:
+                del self._inflight[domain]
+                self._started.pop(domain, None)
+
+    def inflight(self):
+        # (queued or running, running past their timeout)
+        now = time.monotonic()
+        with self._lock:
+            stuck = sum(1 for started in self._started.values() if now - started > self.timeout)
+            return len(self._inflight), stuck
+
+    def submit(self, domain):
+        # Start (or join) a lookup for domain and return its future. When
+        # max_inflight lookups are already pending the domain is not looked
+        # up (or cached) and the future resolves to None right away.
+        with self._lock:
+            future = self._inflight.get(domain)
+            if future is not None:
+                return future
+            if len(self._inflight) >= self.max_inflight:
+                metrics.incr("whois_lookups_total", result="shed")
+                future = Future()
+                future.set_result(None)
+                return future
+            future = self._executor.submit(self._lookup_and_cache, domain)
+            self._inflight[domain] = future
+        # Outside the lock: the callback runs right away (and takes the lock)
+        # if the lookup has already finished
+        future.add_done_callback(lambda f, d=domain: self._done(d, f))
+        return future
+
+    def resolve_many(self, domains):
+        # Returns {domain: age or None}; lookups run concurrently
+        results = {}
+        pending = {}
+        for domain in dict.fromkeys(d.lower() for d in domains if d):
+            age = self.cache.get(domain)
+            if age is _MISSING:
+                metrics.incr("whois_cache_total", result="miss")
+                pending[domain] = self.submit(domain)
+            else:
+                metrics.incr("whois_cache_total", result="hit")
+                results[domain] = age
+
+        for domain, future in pending.items():
+            results[domain] = self._wait(domain, future)
+        return results
+
+    def _wait(self, domain, future):
+        # Each lookup gets its own timeout counted from when it started
+        # running; one still queued after a full timeout is given up on too
+        queued_deadline = time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                started = self._started.get(domain)
+            deadline = queued_deadline if started is None else started + self.timeout
+            try:
+                return future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                with self._lock:
+                    now_started = self._started.get(domain)
+                if started is None and now_started is not None:
+                    # Started while we were waiting: wait out its own timeout
+                    continue
+                # Leave the lookup running; it will still populate the cache
+                metrics.incr("whois_lookups_total", result="timeout" if started is not None else "queued")
+                return None
+
+    def resolve(self, domain):
+        return self.resolve_many([domain]).get(domain.lower())
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = DomainAgeResolver(cache=DomainAgeCache(path=config.WHOIS_CACHE_PATH or None))
+        return _resolver
+
+
+def set_resolver(resolver):
+    # Swap the process-wide resolver, e.g. for one backed by make_static_lookup
+    global _resolver
+    with _resolver_lock:
+        _resolver = resolver